@@ -4,21 +4,118 @@ import streamlit as st
 from helpers import (
     CollectionName,
     STREAMLIT_STYLING,
-    connect_to_weaviate,
     get_top_companies,
-    weaviate_query,
-    get_pprof_results,
+    run_query_fanout,
+    generate_from_objects,
+    TimedStream,
+    DEFAULT_RAG_MODELS,
+    SEARCH_TYPE_ALPHAS,
+    TARGET_VECTORS,
+)
+from connections import AsyncConnectionManager, ConnectionManager, LoadBalancer
+from metrics_collector import MetricsCollector
+from caching import QueryCache, SemanticAnswerCache
+from embeddings import (
+    CachedEmbedder,
+    EmbeddingCache,
+    HashEmbedder,
+    MicroBatchingEmbedder,
+    embedder_from_config,
 )
 import plotly.graph_objs as go
+from collections import deque
+import numpy as np
 from datetime import datetime
 import time
-import re
+import json
+import os
 
 st.set_page_config(page_title="Scalable RAG with Weaviate", layout="wide")
 
 st.markdown(STREAMLIT_STYLING, unsafe_allow_html=True)
 
-with connect_to_weaviate() as client:
+
+@st.cache_resource
+def get_connection_manager() -> ConnectionManager:
+    # Warm clients shared by all sessions & fragments, instead of connecting on every rerun
+    return ConnectionManager(size=2)
+
+
+connection_manager = get_connection_manager()
+
+
+@st.cache_resource
+def get_async_connection_manager() -> AsyncConnectionManager:
+    # One async client (on its own event loop) for the concurrent side-by-side searches
+    return AsyncConnectionManager()
+
+
+async_connection_manager = get_async_connection_manager()
+
+# Shared background sampling of cluster metrics
+METRICS_INTERVAL_S = float(os.environ.get("METRICS_INTERVAL_S", 2))
+METRICS_RETENTION = int(os.environ.get("METRICS_RETENTION", 300))  # Samples kept
+
+
+@st.cache_resource
+def get_metrics_collector() -> MetricsCollector:
+    return MetricsCollector(
+        connection_manager.client,
+        interval=METRICS_INTERVAL_S,
+        retention=METRICS_RETENTION,
+    ).start()
+
+
+metrics_collector = get_metrics_collector()
+
+
+@st.cache_resource
+def get_load_balancer():
+    # Spread queries over several nodes if WEAVIATE_ENDPOINTS is set, e.g.
+    # "localhost:8080:50051,localhost:8081:50152,localhost:8082:50153"
+    return LoadBalancer.from_env()
+
+
+load_balancer = get_load_balancer()
+
+
+@st.cache_resource
+def get_query_cache() -> QueryCache:
+    # One cache per app process, shared across sessions
+    return QueryCache(maxsize=256, ttl=300, balancer=load_balancer)
+
+
+query_cache = get_query_cache()
+
+
+@st.cache_resource
+def get_embedding_cache() -> EmbeddingCache:
+    return EmbeddingCache(path="data/query_embeddings.sqlite")
+
+
+@st.cache_resource
+def get_query_embedder(_config, config_key: str):
+    # Shared across sessions, so concurrent queries are embedded in batched provider calls
+    base_embedder = embedder_from_config(_config, "text_with_metadata")
+    if base_embedder is None:
+        return None
+    return CachedEmbedder(
+        MicroBatchingEmbedder(base_embedder, max_batch_size=32, max_wait_ms=5),
+        get_embedding_cache(),
+    )
+
+
+@st.cache_resource
+def get_ttft_history() -> deque:
+    # Time-to-first-token (s) of recent streamed generations, across sessions
+    return deque(maxlen=100)
+
+
+@st.cache_resource
+def get_answer_cache(_embedder) -> SemanticAnswerCache:
+    return SemanticAnswerCache(_embedder, similarity_threshold=0.92, min_overlap=0.8)
+
+with connection_manager.client() as client:
     st.markdown(
         "<div class='stHeader'><h1>Scalable RAG with Weaviate</h1></div>",
         unsafe_allow_html=True,
@@ -30,6 +127,12 @@ with connect_to_weaviate() as client:
     config = collection.config.get()
     mt_enabled = config.multi_tenancy_config.enabled
 
+    # Vectorize queries client-side (with a persistent cache), if the vectorizer is supported
+    query_embedder = get_query_embedder(
+        config, json.dumps(config.to_dict(), sort_keys=True, default=str)
+    )
+    answer_cache = get_answer_cache(query_embedder or HashEmbedder())
+
     # Create two main columns
     col1, col2 = st.columns([2, 1], gap="large")
 
@@ -69,8 +172,8 @@ with connect_to_weaviate() as client:
 
         st.markdown("#### Results")
 
-        search_response = weaviate_query(
-            collection, query, company_filter, limit, search_type
+        search_response = query_cache.query(
+            collection, query, company_filter, limit, search_type, embedder=query_embedder
         )
 
         st.markdown(f"For query: `{query}`")
@@ -83,6 +186,35 @@ with connect_to_weaviate() as client:
                     st.write(f"Created at: {o.properties['created_at']}")
                     st.write(f"Full text: {o.properties['text']}")
 
+        # ===== Side-by-side comparison (concurrent async queries) =====
+
+        if st.checkbox("Compare search types & named vectors side by side"):
+            start = time.perf_counter()
+            fanout_results = run_query_fanout(
+                async_connection_manager,
+                collection_name,
+                query,
+                company_filter,
+                limit,
+                embedder=query_embedder,
+            )
+            st.caption(f"All searches took {time.perf_counter() - start:.2f}s in total")
+            for target_vector in TARGET_VECTORS:
+                st.markdown(f"Target vector: `{target_vector}`")
+                for st_col, st_name in zip(
+                    st.columns(len(SEARCH_TYPE_ALPHAS)), SEARCH_TYPE_ALPHAS
+                ):
+                    with st_col:
+                        st.markdown(f"**{st_name}**")
+                        result = fanout_results[(st_name, target_vector)]
+                        if isinstance(result, BaseException):
+                            st.error(f"{type(result).__name__}: {result}")
+                            continue
+                        for o in result.objects:
+                            st.write(
+                                f"**{o.properties['company_author']}**: {o.properties['text'][:50]}..."
+                            )
+
         # ===== RAG =====
 
         # Using claudette (https://claudette.answer.ai/)
@@ -93,91 +225,148 @@ with connect_to_weaviate() as client:
                 label="What should we do with the search results?",
             )
 
+            gen_c1, gen_c2 = st.columns(2, gap="large")
+            with gen_c1:
+                generation_provider = st.radio(
+                    label="Generate with",
+                    options=["Claude", "Ollama", "Weaviate"],
+                    horizontal=True,
+                    index=0,
+                    help="Claude & Ollama reuse the results above; Weaviate re-runs the search with its generative module",
+                )
+                stream_tokens = st.checkbox(
+                    "Stream tokens", value=True, disabled=generation_provider == "Weaviate"
+                )
+            with gen_c2:
+                if generation_provider != "Weaviate":
+                    provider = generation_provider.lower()
+                    generation_model = st.text_input("Model", value=DEFAULT_RAG_MODELS[provider])
+                    max_context_chars = st.number_input(
+                        "Context size (characters)", value=8000, min_value=500, step=500
+                    )
+
+            # Answers are only reused if generated with the same settings
+            if generation_provider == "Weaviate":
+                generation_settings = ("weaviate", None, None)
+            else:
+                generation_settings = (provider, generation_model, int(max_context_chars))
+
             if st.button("Generate response"):
-                with st.spinner("Generating response..."):
-                    search_response = weaviate_query(
-                        collection, query, company_filter, limit, search_type, rag_query
+                object_ids = [o.uuid for o in search_response.objects]
+                generated = None
+                cached = answer_cache.lookup(query, rag_query, object_ids, generation_settings)
+                if cached:
+                    generated = cached.answer
+                elif generation_provider == "Weaviate":
+                    with st.spinner("Generating response..."):
+                        generated = query_cache.query(
+                            collection,
+                            query,
+                            company_filter,
+                            limit,
+                            search_type,
+                            rag_query,
+                            embedder=query_embedder,
+                        ).generated
+                        answer_cache.store(query, rag_query, object_ids, generated, generation_settings)
+                elif stream_tokens:
+                    # Stream tokens from a client-side model, as they arrive
+                    stream = TimedStream(
+                        generate_from_objects(
+                            rag_query,
+                            search_response.objects,
+                            provider,
+                            model=generation_model,
+                            max_context_chars=max_context_chars,
+                            stream=True,
+                        )
                     )
+                    with st.container(height=250, border=True):
+                        streamed = st.write_stream(stream)
+                    if stream.ttft is not None:
+                        ttft_history = get_ttft_history()
+                        ttft_history.append(stream.ttft)
+                        st.caption(
+                            f"Time to first token: {stream.ttft:.2f}s "
+                            f"(median of last {len(ttft_history)}: {np.median(ttft_history):.2f}s), "
+                            f"total: {stream.total:.2f}s"
+                        )
+                    else:
+                        st.caption("No tokens were generated.")
+                    answer_cache.store(query, rag_query, object_ids, streamed, generation_settings)
+                else:
+                    with st.spinner("Generating response..."):
+                        generated = generate_from_objects(
+                            rag_query,
+                            search_response.objects,
+                            provider,
+                            model=generation_model,
+                            max_context_chars=max_context_chars,
+                        )
+                        answer_cache.store(query, rag_query, object_ids, generated, generation_settings)
 
-                    if search_response:
-                        with st.container(height=250, border=True):
-                            st.write(search_response.generated)
+                if generated:
+                    if cached:
+                        st.caption(
+                            f"⚡ Cached answer (similarity {cached.similarity:.2f}, "
+                            f"results overlap {cached.overlap:.0%})"
+                        )
+                    with st.container(height=250, border=True):
+                        st.write(generated)
 
     with col2:
         st.markdown("### Cluster statistics")
 
         with st.container(border=True):
-            @st.fragment(run_every=2)
+            @st.fragment(run_every=METRICS_INTERVAL_S)
             def update_cluster_stats():
-                with connect_to_weaviate() as stats_client:
-                    stats_collection = stats_client.collections.get(collection_name)
-                    if mt_enabled:
+                if mt_enabled:
+                    with connection_manager.client() as stats_client:
+                        stats_collection = stats_client.collections.get(collection_name)
                         tenants = stats_collection.tenants.get()
                         st.metric(label="Tenant count", value=len(tenants))
-                    else:
-                        obj_count = stats_collection.aggregate.over_all(total_count=True).total_count
-                        st.metric(label="Object count", value=obj_count)
-                time.sleep(2)
+                else:
+                    obj_count = metrics_collector.latest()["object_count"]
+                    st.metric(
+                        label="Object count",
+                        value="-" if np.isnan(obj_count) else int(obj_count),
+                    )
 
             update_cluster_stats()
 
         with st.container(border=True):
-            node_data = client.cluster.nodes(output="verbose")
-            st.metric(label="Nodes", value=len(node_data))
-
-        # with st.container(border=True):
-        #     result = get_pprof_results()
-
-        #     if result.returncode == 0:
-        #         match = re.search(
-        #             r"Showing nodes accounting for (\d+\.?\d*)MB, (\d+\.?\d*)% of (\d+\.?\d*)MB total",
-        #             result.stdout,
-        #         )
-        #         if match:
-        #             total_mb = float(match.group(3))
-        #             st.metric(label="Memory usage", value=f"{total_mb:.1f} MB")
-        #     else:
-        #         st.error("Error running pprof")
+
+            @st.fragment(run_every=METRICS_INTERVAL_S)
+            def update_node_stats():
+                # Verbose node info, polled once per interval by the shared collector
+                cluster = metrics_collector.latest_cluster
+                if cluster is None:
+                    st.metric(label="Nodes", value="-")
+                    return
+                st.metric(label="Nodes", value=len(cluster.nodes))
+                for warning in cluster.warnings:
+                    st.warning(warning, icon="⚠️")
+                with st.expander("Per-node & per-shard stats"):
+                    st.dataframe([vars(n) for n in cluster.nodes], hide_index=True)
+                    st.dataframe([vars(sh) for sh in cluster.shards], hide_index=True)
+
+            update_node_stats()
 
         with st.container(border=True):
 
-            @st.fragment(run_every=2)
+            @st.fragment(run_every=METRICS_INTERVAL_S)
             def update_memory_chart():
-                # Initialize data for the plot
-                if "memory_data" not in st.session_state:
-                    st.session_state.memory_data = {"time": [], "usage": []}
-
-                # Function to update memory data
-                def update_memory_data():
-                    result = get_pprof_results()
-                    if result.returncode == 0:
-                        match = re.search(
-                            r"Showing nodes accounting for (\d+\.?\d*)MB, (\d+\.?\d*)% of (\d+\.?\d*)MB total",
-                            result.stdout,
-                        )
-                        if match:
-                            total_mb = float(match.group(3))
-                            current_time = datetime.now().strftime("%H:%M:%S")
-                            st.session_state.memory_data["time"].append(current_time)
-                            st.session_state.memory_data["usage"].append(total_mb)
-
-                            # Keep only the last 50 data points
-                            if len(st.session_state.memory_data["time"]) > 50:
-                                st.session_state.memory_data[
-                                    "time"
-                                ] = st.session_state.memory_data["time"][-50:]
-                                st.session_state.memory_data[
-                                    "usage"
-                                ] = st.session_state.memory_data["usage"][-50:]
-
-                # Update memory data
-                update_memory_data()
+                # Read the shared sampler's buffers; no polling per session
+                series = metrics_collector.series()
+                times = [
+                    datetime.fromtimestamp(t).strftime("%H:%M:%S") for t in series["time"]
+                ]
 
                 # Create and display the plot
                 fig = go.Figure(
                     data=go.Scatter(
-                        x=st.session_state.memory_data["time"],
-                        y=st.session_state.memory_data["usage"],
+                        x=times,
+                        y=series["heap_mb"],
                         mode="lines+markers",
                     ),
                 )
@@ -196,13 +385,41 @@ with connect_to_weaviate() as client:
                 st.plotly_chart(
                     fig, use_container_width=True, config={"displayModeBar": False}
                 )
-
-                # Rerun this fragment after a delay
-                time.sleep(2)
+                if metrics_collector.last_error:
+                    st.caption(f"Last sampling error: {metrics_collector.last_error}")
 
             update_memory_chart()
 
         st.markdown("### Under the hood")
+        with st.expander("Query cache"):
+            cache_stats = query_cache.stats()
+            cache_c1, cache_c2 = st.columns(2)
+            cache_c1.metric(label="Hit rate", value=f"{cache_stats['hit_rate']:.0%}")
+            cache_c2.metric(
+                label="Entries", value=f"{cache_stats['size']} / {cache_stats['maxsize']}"
+            )
+            st.json(cache_stats)
+            st.markdown("Semantic answer cache")
+            st.json(answer_cache.stats())
+        with st.expander("Heap profile (top functions)"):
+            heap_profile = metrics_collector.latest_profile
+            if heap_profile is not None:
+                st.json(
+                    {
+                        "totals": heap_profile.totals(),
+                        "top_inuse_space": [vars(f) for f in heap_profile.top(10, "inuse_space")],
+                        "top_alloc_space": [vars(f) for f in heap_profile.top(10, "alloc_space")],
+                    }
+                )
+            else:
+                st.info("No heap profile sampled yet.")
+        with st.expander("Connection pool"):
+            st.json(connection_manager.stats())
+            st.markdown("Async client (side-by-side searches)")
+            st.json(async_connection_manager.stats())
+            if load_balancer is not None:
+                st.markdown("Load balancing across nodes")
+                st.json(load_balancer.stats())
         with st.expander("Weaviate configuration (JSON)"):
             with st.container(height=300):
                 st.json(config.to_dict())
@@ -0,0 +1,335 @@
+from helpers import CollectionName, SEARCH_TYPE_ALPHAS
+from weaviate.classes.query import Filter
+from concurrent.futures import ThreadPoolExecutor, Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Iterable
+from pathlib import Path
+import numpy as np
+import threading
+import resource
+import os
+import requests
+import hashlib
+import json
+import time
+
+
+@dataclass
+class WorkloadQuery:
+    """One entry of a query workload file (JSON Lines, one object per line)."""
+
+    query: str
+    search_type: str = "Hybrid"  # "Hybrid", "Vector" or "Keyword"; ignored if `alpha` is set
+    alpha: Optional[float] = None
+    limit: int = 5
+    company_filter: Optional[str] = None  # `like` pattern, e.g. "*amazon*"
+    created_after: Optional[str] = None  # ISO 8601
+    created_before: Optional[str] = None
+    target_vector: str = "text_with_metadata"
+
+    @property
+    def label(self) -> str:
+        return f"alpha={self.alpha}" if self.alpha is not None else self.search_type
+
+    @property
+    def key(self) -> str:
+        """Stable ID, used to match recorded responses."""
+        payload = json.dumps(asdict(self), sort_keys=True)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def filters(self):
+        filters = []
+        if self.company_filter:
+            filters.append(Filter.by_property("company_author").like(self.company_filter))
+        if self.created_after:
+            filters.append(
+                Filter.by_property("created_at").greater_or_equal(
+                    datetime.fromisoformat(self.created_after)
+                )
+            )
+        if self.created_before:
+            filters.append(
+                Filter.by_property("created_at").less_than(
+                    datetime.fromisoformat(self.created_before)
+                )
+            )
+        return Filter.all_of(filters) if filters else None
+
+
+def load_workload(path: str) -> List[WorkloadQuery]:
+    with open(path) as f:
+        return [WorkloadQuery(**json.loads(line)) for line in f if line.strip()]
+
+
+@dataclass
+class QueryResult:
+    label: str
+    key: str
+    latency_s: float  # From the scheduled start (includes queueing delay at a target QPS)
+    service_time_s: float  # From the actual send
+    n_results: int = 0
+    uuids: Optional[List[str]] = None
+    error: Optional[str] = None
+
+
+class WeaviateQueryBackend:
+    """Runs workload queries against a Weaviate collection (the client is shared across threads)."""
+
+    def __init__(self, client, collection_name: str = CollectionName.SUPPORTCHAT):
+        self.collection = client.collections.get(collection_name)
+
+    def run(self, q: WorkloadQuery) -> List[str]:
+        response = self.collection.query.hybrid(
+            query=q.query,
+            alpha=q.alpha if q.alpha is not None else SEARCH_TYPE_ALPHAS[q.search_type],
+            target_vector=q.target_vector,
+            filters=q.filters(),
+            limit=q.limit,
+        )
+        return [str(o.uuid) for o in response.objects]
+
+
+class ReplayQueryBackend:
+    """Runs workload queries against a `StandInServer`, over HTTP."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self._local = threading.local()
+
+    def run(self, q: WorkloadQuery) -> List[str]:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        response = self._local.session.get(f"{self.url}/query/{q.key}", timeout=30)
+        response.raise_for_status()
+        return response.json()["uuids"]
+
+
+def run_load(
+    backend,
+    workload: List[WorkloadQuery],
+    n_requests: Optional[int] = None,
+    concurrency: int = 8,
+    qps: Optional[float] = None,
+) -> List[QueryResult]:
+    """
+    Replay `workload` (cycling through it) for `n_requests` requests.
+
+    With `qps`, requests are started on a fixed schedule (open loop), and latency is
+    measured from each request's scheduled time. Otherwise, `concurrency` workers
+    send requests back to back (closed loop).
+    """
+    n_requests = n_requests or len(workload)
+
+    def _one(q: WorkloadQuery, scheduled: Optional[float]) -> QueryResult:
+        sent = time.perf_counter()
+        result = QueryResult(label=q.label, key=q.key, latency_s=0.0, service_time_s=0.0)
+        try:
+            result.uuids = backend.run(q)
+            result.n_results = len(result.uuids)
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        done = time.perf_counter()
+        result.service_time_s = done - sent
+        result.latency_s = done - (scheduled if scheduled is not None else sent)
+        return result
+
+    futures: List[Future] = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        for i in range(n_requests):
+            q = workload[i % len(workload)]
+            if qps:
+                scheduled = start + i / qps
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                scheduled = None
+            futures.append(executor.submit(_one, q, scheduled))
+    return [f.result() for f in futures]
+
+
+def latency_summary(latencies_s: Iterable[float]) -> Dict[str, float]:
+    arr = np.asarray(list(latencies_s), dtype=np.float64) * 1000
+    if arr.size == 0:
+        return {}
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "mean_ms": float(arr.mean()),
+        "max_ms": float(arr.max()),
+    }
+
+
+def summarize(results: List[QueryResult], wall_time_s: float) -> Dict[str, Any]:
+    """Latency percentiles, throughput & error rate, per search type and overall."""
+    groups: Dict[str, List[QueryResult]] = {"all": results}
+    for r in results:
+        groups.setdefault(r.label, []).append(r)
+
+    report = {}
+    for label, group in groups.items():
+        ok = [r for r in group if r.error is None]
+        errors = [r.error for r in group if r.error is not None]
+        report[label] = {
+            "requests": len(group),
+            "errors": len(errors),
+            "error_rate": len(errors) / len(group) if group else 0.0,
+            "throughput_qps": len(ok) / wall_time_s if wall_time_s > 0 else 0.0,
+            "latency": latency_summary(r.latency_s for r in ok),
+            "service_time": latency_summary(r.service_time_s for r in ok),
+            "example_errors": sorted(set(errors))[:3],
+        }
+    return report
+
+
+def save_recording(results: List[QueryResult], path: str) -> None:
+    """Save responses (as JSON Lines) for a `StandInServer` to replay."""
+    with open(path, "w") as f:
+        for r in results:
+            if r.error is None:
+                f.write(
+                    json.dumps(
+                        {"key": r.key, "uuids": r.uuids, "service_time_s": r.service_time_s}
+                    )
+                    + "\n"
+                )
+
+
+class StandInServer:
+    """
+    Local HTTP server that replays recorded query responses, with their recorded service times.
+
+    Lets the benchmark (concurrency, pacing & reporting) run offline, e.g. in CI:
+    `GET /query/<key>` returns `{"uuids": [...]}` after the recorded delay, or 404.
+    """
+
+    def __init__(self, recording_path: str, host: str = "127.0.0.1", port: int = 0, speedup: float = 1.0):
+        self.responses: Dict[str, List[dict]] = {}
+        for line in Path(recording_path).read_text().splitlines():
+            if line.strip():
+                entry = json.loads(line)
+                self.responses.setdefault(entry["key"], []).append(entry)
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.speedup = speedup
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    def _next_response(self, key: str) -> Optional[dict]:
+        # Cycle through the recordings of a query, to replay its latency distribution
+        recordings = self.responses.get(key)
+        if not recordings:
+            return None
+        with self._lock:
+            i = self._counters.get(key, 0)
+            self._counters[key] = i + 1
+        return recordings[i % len(recordings)]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                entry = None
+                if self.path.startswith("/query/"):
+                    entry = server._next_response(self.path[len("/query/"):])
+                if entry is None:
+                    self.send_error(404, "No recorded response")
+                    return
+                time.sleep(entry["service_time_s"] / server.speedup)
+                body = json.dumps({"uuids": entry["uuids"]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StandInServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StandInServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def _current_rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None  # Not Linux
+
+
+class ResourceMonitor:
+    """
+    Measures client CPU time and peak RSS of this process while in use (`with ResourceMonitor() as m:`).
+
+    RSS is sampled every `interval` seconds on Linux; elsewhere, `peak_rss_bytes`
+    falls back to the process-lifetime peak.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.cpu_s = 0.0
+        self.wall_s = 0.0
+        self.peak_rss_bytes = 0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            rss = _current_rss_bytes()
+            if rss is not None:
+                self.peak_rss_bytes = max(self.peak_rss_bytes, rss)
+
+    def __enter__(self) -> "ResourceMonitor":
+        self._cpu_start = time.process_time()
+        self._wall_start = time.perf_counter()
+        self.peak_rss_bytes = _current_rss_bytes() or 0
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop_event.set()
+        self._thread.join()
+        self.cpu_s = time.process_time() - self._cpu_start
+        self.wall_s = time.perf_counter() - self._wall_start
+        if _current_rss_bytes() is None:
+            # ru_maxrss is in KiB on Linux, bytes on macOS
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak_rss_bytes = maxrss if os.uname().sysname == "Darwin" else maxrss * 1024
+
+
+def format_table(rows: List[Dict[str, Any]], columns: List[str]) -> str:
+    """Plain-text table of `rows`, for printing."""
+    cells = [[str(c) for c in columns]] + [
+        [f"{r[c]:.1f}" if isinstance(r[c], float) else str(r[c]) for c in columns] for r in rows
+    ]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(columns))]
+    lines = ["  ".join(v.ljust(w) for v, w in zip(row, widths)) for row in cells]
+    lines.insert(1, "  ".join("-" * w for w in widths))
+    return "\n".join(lines)
@@ -0,0 +1,286 @@
+from helpers import weaviate_query
+from weaviate.collections import Collection
+from dataclasses import dataclass
+from typing import Dict, Any, Literal, Optional, Tuple, List, Sequence, Callable
+from cachetools import TTLCache
+import numpy as np
+import threading
+import hashlib
+import json
+import time
+
+
+def _normalize_text(text: Optional[str]) -> Optional[str]:
+    if text is None:
+        return None
+    text = " ".join(text.split())
+    return text or None
+
+
+class _CountingTTLCache(TTLCache):
+    """`TTLCache` that counts evictions due to size (expired items are not counted)."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.evictions = 0
+
+    def popitem(self):
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+
+class QueryCache:
+    """
+    Bounded, thread-safe TTL/LRU cache of `weaviate_query` results.
+
+    Entries are keyed on the normalized query parameters. The whole cache is
+    invalidated when the collection's object count or configuration changes;
+    this is checked at most every `validate_interval` seconds, so that a cache
+    hit does not cost a round trip to the cluster.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        ttl: float = 300,
+        validate_interval: float = 5,
+        balancer: Optional[Any] = None,
+    ):
+        self._cache = _CountingTTLCache(maxsize=maxsize, ttl=ttl)
+        # Optional `connections.LoadBalancer`, to spread (and hedge) the queries over nodes
+        self.balancer = balancer
+        self._lock = threading.Lock()
+        self.validate_interval = validate_interval
+        self._versions: Dict[str, Tuple[int, str]] = {}
+        self._validated_at: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _collection_version(collection: Collection) -> Tuple[int, str]:
+        config = json.dumps(collection.config.get().to_dict(), sort_keys=True, default=str)
+        return len(collection), hashlib.sha1(config.encode()).hexdigest()
+
+    def _validate(self, collection: Collection) -> None:
+        name = collection.name
+        now = time.monotonic()
+        with self._lock:
+            if now - self._validated_at.get(name, -float("inf")) < self.validate_interval:
+                return
+            self._validated_at[name] = now
+
+        version = self._collection_version(collection)
+        with self._lock:
+            previous = self._versions.get(name)
+            self._versions[name] = version
+            if previous is not None and previous != version:
+                for key in [k for k in self._cache.keys() if k[0] == name]:
+                    self._cache.pop(key, None)
+                self.invalidations += 1
+
+    def query(
+        self,
+        collection: Collection,
+        query: str,
+        company_filter: str,
+        limit: int,
+        search_type: Literal["Hybrid", "Vector", "Keyword"],
+        rag_query: Optional[str] = None,
+        embedder: Optional[Any] = None,
+    ):
+        """Cached equivalent of `weaviate_query`."""
+        self._validate(collection)
+        key = (
+            collection.name,
+            _normalize_text(query),
+            _normalize_text(company_filter),
+            int(limit),
+            search_type,
+            _normalize_text(rag_query),
+        )
+        with self._lock:
+            response = self._cache.get(key)
+            if response is not None:
+                self.hits += 1
+                return response
+            self.misses += 1
+
+        # Query outside of the lock; concurrent misses for one key may both query
+        args = (query, company_filter, limit, search_type, rag_query, embedder)
+        if self.balancer is not None:
+            name = collection.name
+            response = self.balancer.execute(
+                lambda client: weaviate_query(client.collections.get(name), *args),
+                hedge=None if not rag_query else False,  # Don't pay for generation twice
+            )
+        else:
+            response = weaviate_query(collection, *args)
+        with self._lock:
+            self._cache[key] = response
+        return response
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": self._cache.currsize,
+                "maxsize": self._cache.maxsize,
+                "evictions": self._cache.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+@dataclass
+class CachedAnswer:
+    answer: Any
+    query: str
+    rag_query: str
+    object_ids: frozenset
+    vector: np.ndarray
+    created_at: float
+    settings: tuple = ()  # e.g. (provider, model, max_context_chars); must match exactly
+    similarity: float = 1.0
+    overlap: float = 1.0
+
+
+class SemanticAnswerCache:
+    """
+    Cache of generated RAG answers, matched by meaning rather than exact text.
+
+    A stored answer is served if the embedding of the new `(query, rag_query)` pair
+    has a cosine similarity of at least `similarity_threshold` with the stored one,
+    AND the retrieved object IDs overlap (Jaccard) by at least `min_overlap`, AND it
+    was generated with the same `settings` (e.g. provider, model & context size).
+    Entries expire after `ttl` seconds; the oldest are evicted beyond `maxsize`.
+    If the embedder fails, a lookup is a miss and a store is skipped, so the
+    cache never breaks generation.
+    """
+
+    def __init__(
+        self,
+        embedder,
+        similarity_threshold: float = 0.92,
+        min_overlap: float = 0.8,
+        maxsize: int = 500,
+        ttl: float = 3600,
+    ):
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self.min_overlap = min_overlap
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: List[CachedAnswer] = []
+        self._matrix: Optional[np.ndarray] = None  # Stacked entry vectors, rebuilt lazily
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.embed_errors = 0
+
+    def _embed(self, query: str, rag_query: str) -> Optional[np.ndarray]:
+        text = f"{_normalize_text(query) or ''}\n{_normalize_text(rag_query) or ''}"
+        try:
+            vector = np.asarray(self.embedder.embed([text])[0], dtype=np.float32)
+        except Exception as e:
+            # e.g. the embedding provider is down or rate-limited
+            print(f"Answer cache embedding failed, bypassing the cache: {e}")
+            with self._lock:
+                self.embed_errors += 1
+            return None
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl
+        entries = [e for e in self._entries if e.created_at >= cutoff][-self.maxsize :]
+        if len(entries) != len(self._entries):
+            self._entries = entries
+            self._matrix = None
+
+    def lookup(
+        self, query: str, rag_query: str, object_ids: Sequence[Any], settings: tuple = ()
+    ) -> Optional[CachedAnswer]:
+        """Best matching stored answer, or None."""
+        vector = self._embed(query, rag_query)
+        if vector is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        ids = frozenset(str(i) for i in object_ids)
+        with self._lock:
+            self._expire()
+            if self._entries:
+                if self._matrix is None:
+                    self._matrix = np.stack([e.vector for e in self._entries])
+                similarities = self._matrix @ vector
+                for i in np.argsort(-similarities):
+                    if similarities[i] < self.similarity_threshold:
+                        break
+                    entry = self._entries[i]
+                    if entry.settings != settings:
+                        continue
+                    union = ids | entry.object_ids
+                    overlap = len(ids & entry.object_ids) / len(union) if union else 1.0
+                    if overlap >= self.min_overlap:
+                        self.hits += 1
+                        return CachedAnswer(
+                            answer=entry.answer,
+                            query=entry.query,
+                            rag_query=entry.rag_query,
+                            object_ids=entry.object_ids,
+                            vector=entry.vector,
+                            created_at=entry.created_at,
+                            settings=entry.settings,
+                            similarity=float(similarities[i]),
+                            overlap=overlap,
+                        )
+            self.misses += 1
+            return None
+
+    def store(
+        self,
+        query: str,
+        rag_query: str,
+        object_ids: Sequence[Any],
+        answer: Any,
+        settings: tuple = (),
+    ) -> None:
+        """Store a generated answer; empty answers (e.g. a failed generation) are not stored."""
+        if answer is None or (isinstance(answer, str) and not answer.strip()):
+            return
+        vector = self._embed(query, rag_query)
+        if vector is None:
+            return
+        entry = CachedAnswer(
+            answer=answer,
+            query=query,
+            rag_query=rag_query,
+            object_ids=frozenset(str(i) for i in object_ids),
+            vector=vector,
+            created_at=time.monotonic(),
+            settings=settings,
+        )
+        with self._lock:
+            self._entries.append(entry)
+            self._matrix = None
+            self._expire()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "embed_errors": self.embed_errors,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
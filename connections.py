@@ -0,0 +1,545 @@
+from helpers import connect_to_weaviate, connect_to_weaviate_async, connect_to_weaviate_node
+from weaviate import WeaviateClient, WeaviateAsyncClient
+from weaviate.exceptions import (
+    UnexpectedStatusCodeError,
+    WeaviateConnectionError,
+    WeaviateGRPCUnavailableError,
+    WeaviateQueryError,
+    WeaviateStartUpError,
+    WeaviateTimeoutError,
+)
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from collections import deque
+from dataclasses import dataclass
+from functools import partial
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Iterator, Tuple, TypeVar
+import numpy as np
+import threading
+import asyncio
+import time
+import os
+
+
+T = TypeVar("T")
+
+
+@dataclass
+class _Slot:
+    client: Optional[WeaviateClient] = None
+    leases: int = 0
+    checked_at: float = 0.0
+    needs_check: bool = False
+    checking: bool = False  # A health check or reconnect is running, outside the lock
+
+
+class ConnectionManager:
+    """
+    Process-wide pool of long-lived Weaviate clients, shared across sessions & threads.
+
+    `client()` leases the least-loaded client. Clients are created lazily, and
+    health-checked (`is_ready`) at most every `health_check_interval` seconds,
+    or on the next lease after an error was raised while one was in use. An
+    unhealthy client is replaced transparently; it is closed once its last
+    lease is returned. Checks and reconnects run outside the pool lock, so a
+    slow (re)connection only holds up the leases waiting on that slot.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], WeaviateClient] = connect_to_weaviate,
+        size: int = 2,
+        health_check_interval: float = 10,
+    ):
+        self.factory = factory
+        self.health_check_interval = health_check_interval
+        self._slots = [_Slot() for _ in range(size)]
+        self._retired: Dict[int, WeaviateClient] = {}  # id(client) -> client
+        self._retired_leases: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._slot_checked = threading.Condition(self._lock)
+        self.created = 0
+        self.reconnects = 0
+        self.leases_total = 0
+        self.errors = 0
+
+    def _is_due(self, slot: _Slot) -> bool:
+        # Called with the lock held
+        return (
+            slot.client is None
+            or slot.needs_check
+            or time.monotonic() - slot.checked_at >= self.health_check_interval
+        )
+
+    def _healthy_client(self, client: Optional[WeaviateClient]) -> WeaviateClient:
+        # Called without the lock: `client` if it is ready, otherwise a new one
+        if client is not None:
+            try:
+                if client.is_ready():
+                    return client
+            except Exception:
+                pass
+        return self.factory()
+
+    def _install(self, slot: _Slot, old: Optional[WeaviateClient], new: WeaviateClient) -> None:
+        # Called with the lock held
+        slot.checked_at = time.monotonic()
+        slot.needs_check = False
+        if new is old:
+            return
+        if old is not None:
+            self._retire(slot)
+            self.reconnects += 1
+        slot.client = new
+        self.created += 1
+
+    def _retire(self, slot: _Slot) -> None:
+        old = slot.client
+        slot.client = None
+        if slot.leases == 0:
+            self._close_quietly(old)
+        else:
+            self._retired[id(old)] = old
+            self._retired_leases[id(old)] = slot.leases
+        slot.leases = 0
+
+    @staticmethod
+    def _close_quietly(client: WeaviateClient) -> None:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+    def _release(self, slot: _Slot, client: WeaviateClient, failed: bool) -> None:
+        with self._lock:
+            if slot.client is client:
+                slot.leases -= 1
+                if failed:
+                    slot.needs_check = True
+                return
+            # The client was replaced (or the pool closed) while leased
+            key = id(client)
+            if key not in self._retired_leases:
+                return
+            self._retired_leases[key] -= 1
+            if self._retired_leases[key] == 0:
+                self._close_quietly(self._retired.pop(key))
+                del self._retired_leases[key]
+
+    def _lease(self) -> Tuple[_Slot, WeaviateClient]:
+        while True:
+            with self._lock:
+                while True:
+                    idle = [s for s in self._slots if not s.checking]
+                    if idle:
+                        # Least-loaded slot; an idle connected client beats opening a new one
+                        slot = min(idle, key=lambda s: (s.leases, s.client is None))
+                        break
+                    # Every slot is being checked: use a client still in place, else wait
+                    in_place = [s for s in self._slots if s.client is not None and not s.needs_check]
+                    if in_place:
+                        slot = min(in_place, key=lambda s: s.leases)
+                        break
+                    self._slot_checked.wait()
+                if slot.checking or not self._is_due(slot):
+                    slot.leases += 1
+                    self.leases_total += 1
+                    return slot, slot.client
+                slot.checking = True
+                old = slot.client
+
+            try:
+                new = self._healthy_client(old)
+            except BaseException:
+                with self._lock:
+                    slot.checking = False
+                    self._slot_checked.notify_all()
+                raise
+            with self._lock:
+                self._install(slot, old, new)
+                slot.checking = False
+                self._slot_checked.notify_all()
+            # Lease again: another slot may now be less loaded
+
+    @contextmanager
+    def client(self) -> Iterator[WeaviateClient]:
+        """Lease a connected client; do not close it."""
+        slot, client = self._lease()
+        failed = False
+        try:
+            yield client
+        except Exception:
+            failed = True
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            self._release(slot, client, failed)
+
+    def close(self) -> None:
+        with self._lock:
+            for slot in self._slots:
+                if slot.client is not None:
+                    self._close_quietly(slot.client)
+                    slot.client = None
+                    slot.leases = 0
+            for client in self._retired.values():
+                self._close_quietly(client)
+            self._retired.clear()
+            self._retired_leases.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            leases: List[int] = [s.leases for s in self._slots if s.client is not None]
+            return {
+                "size": len(self._slots),
+                "connected": len(leases),
+                "in_use": sum(leases),
+                "leases_per_client": leases,
+                "leases_total": self.leases_total,
+                "created": self.created,
+                "reconnects": self.reconnects,
+                "errors": self.errors,
+                "retired_pending_close": len(self._retired),
+            }
+
+
+class AsyncConnectionManager:
+    """
+    Process-wide, long-lived async Weaviate client, for concurrent queries from sync code.
+
+    An async client is bound to the event loop it connected on, so it lives on
+    this manager's own loop, in a background thread. `run(fn)` runs `fn(client)`
+    there and waits for its result. Like `ConnectionManager`, the client is
+    created lazily, health-checked at most every `health_check_interval` seconds
+    (or after an error), and replaced if unhealthy; a replaced client is closed
+    once the calls still using it are done.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], WeaviateAsyncClient] = connect_to_weaviate_async,
+        health_check_interval: float = 10,
+    ):
+        self.factory = factory
+        self.health_check_interval = health_check_interval
+        self._client: Optional[WeaviateAsyncClient] = None
+        self._checked_at = 0.0
+        self._needs_check = False
+        self._leases: Dict[int, int] = {}  # id(client) -> calls in progress
+        self._retired: Dict[int, WeaviateAsyncClient] = {}
+        self._connect_lock: Optional[asyncio.Lock] = None  # Created on the loop
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, daemon=True, name="weaviate-async"
+        )
+        self._thread.start()
+        self.created = 0
+        self.reconnects = 0
+        self.calls_total = 0
+        self.errors = 0
+
+    async def _healthy_client(self) -> WeaviateAsyncClient:
+        # Runs on the loop, so the attributes need no lock; only (re)connecting is serialized
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            client = self._client
+            due = (
+                self._needs_check
+                or time.monotonic() - self._checked_at >= self.health_check_interval
+            )
+            if client is not None and due:
+                try:
+                    ready = await client.is_ready()
+                except Exception:
+                    ready = False
+                if not ready:
+                    self._retire(client)
+                    client = self._client = None
+                    self.reconnects += 1
+                self._checked_at = time.monotonic()
+                self._needs_check = False
+            if client is None:
+                client = self.factory()
+                await client.connect()
+                self._client = client
+                self._checked_at = time.monotonic()
+                self._needs_check = False
+                self.created += 1
+            return client
+
+    def _retire(self, client: WeaviateAsyncClient) -> None:
+        if self._leases.get(id(client), 0) == 0:
+            self._loop.create_task(self._close_quietly(client))
+        else:
+            self._retired[id(client)] = client
+
+    @staticmethod
+    async def _close_quietly(client: WeaviateAsyncClient) -> None:
+        try:
+            await client.close()
+        except Exception:
+            pass
+
+    async def _call(self, fn: Callable[[WeaviateAsyncClient], Awaitable[T]]) -> T:
+        client = await self._healthy_client()
+        key = id(client)
+        self._leases[key] = self._leases.get(key, 0) + 1
+        self.calls_total += 1
+        try:
+            return await fn(client)
+        except Exception:
+            self.errors += 1
+            if client is self._client:
+                self._needs_check = True
+            raise
+        finally:
+            self._leases[key] -= 1
+            if self._leases[key] == 0:
+                del self._leases[key]
+                if key in self._retired:
+                    await self._close_quietly(self._retired.pop(key))
+
+    def run(self, fn: Callable[[WeaviateAsyncClient], Awaitable[T]], timeout: Optional[float] = None) -> T:
+        """Run the coroutine `fn(client)` on the shared client, and return its result; do not close the client."""
+        return asyncio.run_coroutine_threadsafe(self._call(fn), self._loop).result(timeout)
+
+    def close(self) -> None:
+        async def _close_all():
+            clients = list(self._retired.values()) + ([self._client] if self._client else [])
+            self._client = None
+            self._retired.clear()
+            for client in clients:
+                await self._close_quietly(client)
+
+        asyncio.run_coroutine_threadsafe(_close_all(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connected": self._client is not None,
+            "in_use": sum(list(self._leases.values())),
+            "calls_total": self.calls_total,
+            "created": self.created,
+            "reconnects": self.reconnects,
+            "errors": self.errors,
+            "retired_pending_close": len(self._retired),
+        }
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    host: str
+    port: int
+    grpc_port: int
+
+    def __str__(self) -> str:
+        return f"{self.host}:{self.port}"
+
+
+def parse_endpoints(spec: str) -> List[Endpoint]:
+    """
+    Parse `host:port:grpc_port` entries, comma-separated.
+
+    e.g. "localhost:8080:50051,localhost:8081:50152,localhost:8082:50153"
+    for the three nodes in `docker-compose-three-nodes.yml`.
+    """
+    endpoints = []
+    for entry in spec.split(","):
+        if entry.strip():
+            host, port, grpc_port = entry.strip().rsplit(":", 2)
+            endpoints.append(Endpoint(host, int(port), int(grpc_port)))
+    return endpoints
+
+
+class _EndpointState:
+    def __init__(self, endpoint: Endpoint, pool_size: int, window: int):
+        self.endpoint = endpoint
+        self.manager = ConnectionManager(
+            factory=partial(
+                connect_to_weaviate_node, endpoint.host, endpoint.port, endpoint.grpc_port
+            ),
+            size=pool_size,
+        )
+        self.latencies: deque = deque(maxlen=window)
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.down_until = 0.0
+
+
+_NODE_GRPC_CODES = ("StatusCode.UNAVAILABLE", "StatusCode.DEADLINE_EXCEEDED")
+
+
+def _is_node_failure(e: Exception) -> bool:
+    # Unreachable, timed out or unavailable nodes are failures; e.g. a bad query or filter is not
+    if isinstance(
+        e,
+        (
+            WeaviateConnectionError,
+            WeaviateTimeoutError,
+            WeaviateGRPCUnavailableError,
+            WeaviateStartUpError,
+            ConnectionError,
+            TimeoutError,
+        ),
+    ):
+        return True
+    if isinstance(e, UnexpectedStatusCodeError):
+        return e.status_code >= 500
+    if isinstance(e, WeaviateQueryError):
+        # gRPC errors are wrapped, with the status code in the message
+        return any(code in e.message for code in _NODE_GRPC_CODES)
+    return False
+
+
+class LoadBalancer:
+    """
+    Client-side load balancing of requests over several Weaviate nodes, with optional hedging.
+
+    `execute(fn)` runs `fn(client)` on the healthy node with the fewest requests in
+    flight. A node that fails (connection errors, timeouts, 5xx / unavailable) is
+    skipped for `cooldown` seconds, and the request is retried on another node;
+    any other error (e.g. an invalid query) is raised straight away. With `hedge=True`, if the first node hasn't answered
+    within the recent p95 latency, a duplicate is sent to a second node, and the
+    first successful response wins. Only use this for idempotent reads.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        pool_size: int = 2,
+        hedge: bool = True,
+        hedge_percentile: float = 95,
+        min_hedge_delay: float = 0.01,
+        cooldown: float = 5,
+        window: int = 200,
+    ):
+        if not endpoints:
+            raise ValueError("At least one endpoint is required")
+        self._states = [_EndpointState(e, pool_size, window) for e in endpoints]
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.cooldown = cooldown
+        self._latencies: deque = deque(maxlen=window)  # Across all nodes
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=8 * len(endpoints), thread_name_prefix="weaviate-lb"
+        )
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @classmethod
+    def from_env(cls, var: str = "WEAVIATE_ENDPOINTS", **kwargs) -> Optional["LoadBalancer"]:
+        spec = os.environ.get(var)
+        return cls(parse_endpoints(spec), **kwargs) if spec else None
+
+    def _pick(self, exclude: List[_EndpointState]) -> Optional[_EndpointState]:
+        now = time.monotonic()
+        with self._lock:
+            candidates = [s for s in self._states if s not in exclude]
+            healthy = [s for s in candidates if s.down_until <= now]
+            # If every node is marked down, try one anyway rather than failing outright
+            pool = healthy or candidates
+            if not pool:
+                return None
+            state = min(pool, key=lambda s: (s.in_flight, s.requests))
+            state.in_flight += 1
+            state.requests += 1
+            return state
+
+    def _run(self, state: _EndpointState, fn: Callable[[WeaviateClient], T]) -> T:
+        start = time.perf_counter()
+        try:
+            with state.manager.client() as client:
+                result = fn(client)
+        except Exception as e:
+            if _is_node_failure(e):
+                with self._lock:
+                    state.errors += 1
+                    state.down_until = time.monotonic() + self.cooldown
+            raise
+        finally:
+            with self._lock:
+                state.in_flight -= 1
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            state.latencies.append(elapsed)
+            self._latencies.append(elapsed)
+        return result
+
+    def hedge_delay(self) -> Optional[float]:
+        """Current hedging delay (recent p95 latency), or None until there are enough samples."""
+        with self._lock:
+            if len(self._latencies) < 20:
+                return None
+            latencies = list(self._latencies)
+        return max(self.min_hedge_delay, float(np.percentile(latencies, self.hedge_percentile)))
+
+    def execute(self, fn: Callable[[WeaviateClient], T], hedge: Optional[bool] = None) -> T:
+        hedge = self.hedge if hedge is None else hedge
+        tried: List[_EndpointState] = []
+        futures: List[Future] = []
+        hedge_future: Optional[Future] = None
+        last_error: Optional[BaseException] = None
+
+        def _launch() -> Optional[Future]:
+            state = self._pick(tried)
+            if state is None:
+                return None
+            tried.append(state)
+            future = self._executor.submit(self._run, state, fn)
+            futures.append(future)
+            return future
+
+        _launch()
+        delay = self.hedge_delay() if hedge and len(self._states) > 1 else None
+        while futures:
+            done, _ = wait(futures, timeout=delay, return_when=FIRST_COMPLETED)
+            if not done:
+                # Too slow: hedge with a duplicate on another node (once)
+                delay = None
+                hedge_future = _launch()
+                if hedge_future is not None:
+                    with self._lock:
+                        self.hedges += 1
+                continue
+            for future in done:
+                futures.remove(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if not _is_node_failure(e):
+                        # The request itself is at fault: another node won't do better
+                        raise
+                    last_error = e
+                    continue
+                if future is hedge_future:
+                    with self._lock:
+                        self.hedge_wins += 1
+                # A slower duplicate still in flight finishes in the background
+                return result
+            if not futures:
+                # All attempts so far failed: fail over to a node not yet tried
+                _launch()
+        raise last_error if last_error else RuntimeError("No Weaviate endpoint available")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            nodes = {}
+            now = time.monotonic()
+            for s in self._states:
+                latencies = list(s.latencies)
+                nodes[str(s.endpoint)] = {
+                    "requests": s.requests,
+                    "errors": s.errors,
+                    "in_flight": s.in_flight,
+                    "down": s.down_until > now,
+                    "p50_ms": float(np.percentile(latencies, 50) * 1000) if latencies else None,
+                    "p95_ms": float(np.percentile(latencies, 95) * 1000) if latencies else None,
+                }
+            return {"nodes": nodes, "hedges": self.hedges, "hedge_wins": self.hedge_wins}
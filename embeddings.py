@@ -0,0 +1,390 @@
+from weaviate.collections.classes.config import CollectionConfig
+from typing import Iterable, Iterator, List, Optional, Protocol, Union
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import LRUCache
+from collections import deque
+from pathlib import Path
+import numpy as np
+import threading
+import random
+import time
+import asyncio
+import requests
+import httpx
+import hashlib
+import sqlite3
+import ollama
+import os
+import re
+
+
+class Embedder(Protocol):
+    """Anything that turns a list of texts into a `(len(texts), dim)` float32 array."""
+
+    # Identifies the model, so cached vectors from different models never mix
+    name: str
+
+    def embed(self, texts: List[str]) -> np.ndarray: ...
+
+
+class OllamaEmbedder:
+    def __init__(self, model: str = "nomic-embed-text", host: Optional[str] = None):
+        self.name = f"ollama/{model}"
+        self.model = model
+        self._client = ollama.Client(host=host)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        response = self._client.embed(model=self.model, input=texts)
+        return np.asarray(response["embeddings"], dtype=np.float32)
+
+
+class CohereEmbedder:
+    def __init__(
+        self,
+        model: str = "embed-multilingual-light-v3.0",
+        input_type: str = "search_query",
+        api_key: Optional[str] = None,
+    ):
+        self.name = f"cohere/{model}/{input_type}"
+        self.model = model
+        self.input_type = input_type
+        self._session = requests.Session()
+        self._session.headers["Authorization"] = f"Bearer {api_key or os.environ['COHERE_API_KEY']}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        response = self._session.post(
+            "https://api.cohere.com/v1/embed",
+            json={
+                "texts": texts,
+                "model": self.model,
+                "input_type": self.input_type,
+                "embedding_types": ["float"],
+            },
+            timeout=30,
+        )
+        response.raise_for_status()
+        return np.asarray(response.json()["embeddings"]["float"], dtype=np.float32)
+
+
+class OpenAIEmbedder:
+    def __init__(self, model: str = "text-embedding-3-small", api_key: Optional[str] = None):
+        self.name = f"openai/{model}"
+        self.model = model
+        self._session = requests.Session()
+        self._session.headers["Authorization"] = f"Bearer {api_key or os.environ['OPENAI_API_KEY']}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        response = self._session.post(
+            "https://api.openai.com/v1/embeddings",
+            json={"input": texts, "model": self.model},
+            timeout=30,
+        )
+        response.raise_for_status()
+        data = sorted(response.json()["data"], key=lambda d: d["index"])
+        return np.asarray([d["embedding"] for d in data], dtype=np.float32)
+
+
+class HashEmbedder:
+    """
+    Deterministic, local stand-in embedder (hashed bag of words), e.g. for tests.
+
+    Texts sharing words get similar vectors, but the vectors have no relation
+    to those of a real model; don't mix them with a collection's own vectors.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.name = f"hash/{dim}"
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in re.findall(r"\w+", text.lower()):
+                h = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+                out[i, h % self.dim] += 1.0 if (h >> 63) else -1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.where(norms == 0, 1, norms)
+
+
+def embedder_from_config(config: CollectionConfig, target_vector: str) -> Optional[Embedder]:
+    """
+    Client-side embedder matching the vectorizer of `target_vector` in a collection config,
+    or None if the vectorizer is not supported.
+    """
+    vector_config = config.vector_config
+    if not vector_config or target_vector not in vector_config:
+        return None
+    vectorizer = vector_config[target_vector].vectorizer
+    module = getattr(vectorizer.vectorizer, "value", vectorizer.vectorizer)
+    model = vectorizer.model.get("model")
+    # Without a model in the config, use the embedder's default (same as in `prep/1_create_collection_*.py`)
+    kwargs = {"model": model} if model else {}
+    if module == "text2vec-ollama":
+        return OllamaEmbedder(**kwargs)
+    if module == "text2vec-cohere":
+        return CohereEmbedder(**kwargs)
+    if module == "text2vec-openai":
+        return OpenAIEmbedder(**kwargs)
+    return None
+
+
+# Transient network errors of `requests` (Cohere, OpenAI) and `httpx` (Ollama)
+_RETRYABLE_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    httpx.NetworkError,
+    httpx.TimeoutException,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+def _is_retryable(e: Exception) -> bool:
+    # Rate limits, server errors & network errors are transient; anything else (e.g. a
+    # bad request, or a response we failed to parse) would fail the same way again
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return _is_retryable_status(e.response.status_code)
+    if isinstance(e, ollama.ResponseError):
+        return _is_retryable_status(e.status_code)
+    return isinstance(e, _RETRYABLE_ERRORS)
+
+
+def _is_retryable_status(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+def _retry_after(e: Exception) -> Optional[float]:
+    response = getattr(e, "response", None)
+    try:
+        return float(response.headers["Retry-After"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def embed_with_retry(
+    embedder: Embedder,
+    texts: List[str],
+    max_retries: int = 5,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+) -> np.ndarray:
+    """
+    `embedder.embed(texts)`, retried with exponential backoff (and jitter) on transient errors.
+
+    A `Retry-After` header on a rate-limit response overrides the computed delay.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return embedder.embed(texts)
+        except Exception as e:
+            if attempt == max_retries or not _is_retryable(e):
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                delay = min(max_delay, base_delay * 2**attempt) * random.uniform(0.5, 1.0)
+            print(f"Embedding {len(texts)} texts failed ({type(e).__name__}: {e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def embed_batches(
+    embedder: Embedder,
+    batches: Iterable[List[str]],
+    concurrency: int = 4,
+    max_retries: int = 5,
+) -> Iterator[np.ndarray]:
+    """
+    Embed each batch of texts, with up to `concurrency` provider calls in flight.
+
+    Results are yielded in input order. `batches` is consumed lazily, at most
+    `2 * concurrency` batches ahead of the caller.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed") as executor:
+        pending: deque = deque()
+        for texts in batches:
+            pending.append(executor.submit(embed_with_retry, embedder, texts, max_retries))
+            if len(pending) >= 2 * concurrency:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class EmbeddingCache:
+    """
+    Two-level cache of text embeddings: an in-memory LRU, backed by an SQLite file.
+
+    Keys are `(embedder name, text)`, so one store can hold vectors of several models.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None, maxsize: int = 10000):
+        self._memory = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(model TEXT, text TEXT, vector BLOB, PRIMARY KEY (model, text))"
+            )
+            self._db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        key = (model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector FROM embeddings WHERE model = ? AND text = ?", key
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._memory[key] = vector
+            if vector is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return vector
+
+    def put(self, model: str, text: str, vector: np.ndarray) -> None:
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._memory[(model, text)] = vector
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                    (model, text, vector.tobytes()),
+                )
+                self._db.commit()
+
+
+class CachedEmbedder:
+    """Embed texts with `embedder`, vectorizing each distinct text only once."""
+
+    def __init__(self, embedder: Embedder, cache: Optional[EmbeddingCache] = None):
+        self.embedder = embedder
+        self.name = embedder.name
+        self.cache = cache if cache is not None else EmbeddingCache()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = [self.cache.get(self.name, t) for t in texts]
+        missing = sorted({t for t, v in zip(texts, vectors) if v is None})
+        if missing:
+            new_vectors = dict(zip(missing, self.embedder.embed(missing)))
+            for text, vector in new_vectors.items():
+                self.cache.put(self.name, text, vector)
+            vectors = [new_vectors[t] if v is None else v for t, v in zip(texts, vectors)]
+        return np.stack(vectors)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+
+class MicroBatchingEmbedder:
+    """
+    Coalesces concurrent embedding requests into batched provider calls.
+
+    Requests are queued on a background event loop. A batch is sent once it holds
+    `max_batch_size` texts, or `max_wait_ms` after its first text arrived, with at
+    most `max_concurrent_batches` provider calls in flight. Results are fanned back
+    to each caller. Implements the `Embedder` protocol, so it can be wrapped in a
+    `CachedEmbedder`.
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5,
+        max_concurrent_batches: int = 4,
+    ):
+        self.embedder = embedder
+        self.name = embedder.name
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_concurrent_batches = max_concurrent_batches
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._start_lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def _run():
+                    asyncio.set_event_loop(loop)
+                    self._queue = asyncio.Queue()
+                    loop.create_task(self._batcher())
+                    ready.set()
+                    loop.run_forever()
+
+                threading.Thread(target=_run, name="embedding-batcher", daemon=True).start()
+                ready.wait()
+                self._loop = loop
+        return self._loop
+
+    async def _batcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrent_batches)
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await semaphore.acquire()
+            task = loop.create_task(self._flush(batch))
+            task.add_done_callback(lambda _: semaphore.release())
+
+    async def _flush(self, batch: List[tuple]) -> None:
+        texts = list(dict.fromkeys(text for text, _ in batch))  # Unique, in order
+        self.batches += 1
+        try:
+            vectors = await asyncio.get_running_loop().run_in_executor(
+                None, self.embedder.embed, texts
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        by_text = dict(zip(texts, vectors))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+
+    async def _submit(self, text: str) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        self.requests += 1
+        await self._queue.put((text, future))
+        return await future
+
+    async def aembed_query(self, text: str) -> np.ndarray:
+        """Embed one text, from any event loop."""
+        loop = self._ensure_started()
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._submit(text), loop))
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        loop = self._ensure_started()
+        futures = [asyncio.run_coroutine_threadsafe(self._submit(t), loop) for t in texts]
+        return np.stack([f.result() for f in futures])
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+        }
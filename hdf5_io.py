@@ -0,0 +1,453 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Iterator, Sequence, Tuple
+import numpy as np
+import h5py
+import json
+
+
+# Format versions of the HDF5 export files
+# 1: One group per object (named by UUID), holding `vector_<name>`, `object` and `uuid` datasets
+# 2: Columnar - `uuids`, `properties` (JSON) and one `(N, dim)` dataset per named vector
+LEGACY_FORMAT_VERSION = 1
+COLUMNAR_FORMAT_VERSION = 2
+
+DEFAULT_CHUNK_ROWS = 4096
+
+# How vectors are stored in columnar files. "int8" stores per-dimension scales
+# for each block of rows written (`vector_scales/<name>`, starting at the rows
+# in `vector_block_starts`); vectors are decoded to float32 when read.
+VECTOR_ENCODINGS = ("float32", "float16", "int8")
+
+
+class DateTimeEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        return super().default(obj)
+
+
+@dataclass
+class ObjectBlock:
+    """A contiguous slice of exported objects, with vectors stacked per name."""
+
+    uuids: List[str]
+    properties: List[Dict[str, Any]]
+    vectors: Dict[str, np.ndarray]
+
+    def __len__(self) -> int:
+        return len(self.uuids)
+
+    def rows(self) -> Iterator[tuple]:
+        """Yield `(uuid, properties, vectors)` for each object in the block."""
+        for i, uuid in enumerate(self.uuids):
+            yield uuid, self.properties[i], {k: v[i] for k, v in self.vectors.items()}
+
+
+def _vector_chunk_rows(chunk_rows: int, dim: int, itemsize: int = 4) -> int:
+    # Keep vector chunks around 1 MiB (the default HDF5 chunk cache size)
+    return max(1, min(chunk_rows, 2**20 // (dim * itemsize)))
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric int8 quantization of a block of vectors, with one scale per dimension."""
+    scales = np.abs(vectors).max(axis=0) / 127
+    scales[scales == 0] = 1
+    codes = np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def encode_vectors(vectors: np.ndarray, encoding: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """`(stored data, per-dimension scales or None)` for a block of float32 vectors."""
+    if encoding == "float32":
+        return vectors.astype(np.float32, copy=False), None
+    if encoding == "float16":
+        return vectors.astype(np.float16), None
+    if encoding == "int8":
+        return quantize_int8(vectors)
+    raise ValueError(f"Unknown vector encoding {encoding!r}; expected one of {VECTOR_ENCODINGS}")
+
+
+def decode_vectors(data: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """float32 vectors from stored data; `scales` broadcasts, e.g. `(dim,)` or one row per vector."""
+    vectors = data.astype(np.float32, copy=False)
+    return vectors * scales if scales is not None else vectors
+
+
+def cosine_similarities(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Row-wise cosine similarity of two `(N, dim)` arrays."""
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    return np.einsum("ij,ij->i", a, b) / np.where(norms == 0, 1, norms)
+
+
+def encoding_error(
+    vectors: np.ndarray, encoding: str, block_rows: int = DEFAULT_CHUNK_ROWS
+) -> Dict[str, float]:
+    """
+    Cosine error (1 - cosine similarity) between vectors and their stored & decoded version,
+    encoding them in blocks of `block_rows` as `ColumnarWriter` does.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    errors = np.concatenate(
+        [
+            1 - cosine_similarities(block, decode_vectors(*encode_vectors(block, encoding)))
+            for block in np.array_split(vectors, max(1, -(-len(vectors) // block_rows)))
+        ]
+    )
+    return {
+        "mean_cosine_error": float(errors.mean()),
+        "p99_cosine_error": float(np.percentile(errors, 99)),
+        "max_cosine_error": float(errors.max()),
+        "bytes_per_vector": vectors.shape[1] * np.dtype(encoding).itemsize,
+    }
+
+
+def get_format_version(hf: h5py.File) -> int:
+    return int(hf.attrs.get("format_version", LEGACY_FORMAT_VERSION))
+
+
+class ColumnarWriter:
+    """
+    Write objects to an HDF5 file in the columnar (v2) layout.
+
+    Objects are buffered and written in slices of `chunk_rows`. Datasets are
+    created on the first flush, once the vector names and dimensions are known.
+    If `hf` (opened with mode "a") already holds columnar data, new objects are
+    appended after it, e.g. to resume an interrupted export.
+
+    `vector_encoding` ("float32", "float16" or "int8") trades vector precision for
+    file size; the cosine error it introduces is recorded on each vector dataset.
+    """
+
+    def __init__(
+        self,
+        hf: h5py.File,
+        chunk_rows: int = DEFAULT_CHUNK_ROWS,
+        compression: Optional[str] = None,
+        vector_encoding: str = "float32",
+    ):
+        if vector_encoding not in VECTOR_ENCODINGS:
+            raise ValueError(f"Unknown vector encoding {vector_encoding!r}; expected one of {VECTOR_ENCODINGS}")
+        self.hf = hf
+        self.chunk_rows = chunk_rows
+        self.compression = compression
+        self.vector_encoding = vector_encoding
+        self.count = 0
+        # Per vector name: [vectors, sum of cosine errors, max cosine error]
+        self._errors: Dict[str, List[float]] = {}
+        self._uuids: List[str] = []
+        self._properties: List[str] = []
+        self._vectors: Dict[str, List[np.ndarray]] = {}
+        self._update_times: List[int] = []
+        if "uuids" in hf:
+            self._resume()
+        hf.attrs["format_version"] = COLUMNAR_FORMAT_VERSION
+
+    def _resume(self) -> None:
+        if get_format_version(self.hf) != COLUMNAR_FORMAT_VERSION:
+            raise ValueError("Can only append to a columnar (v2) export file")
+        datasets = [self.hf["uuids"], self.hf["properties"], *self.hf["vectors"].values()]
+        if "update_times" in self.hf:
+            datasets.append(self.hf["update_times"])
+        # A run interrupted mid-flush may have extended some datasets but not others
+        self.count = min(ds.shape[0] for ds in datasets)
+        for ds in datasets:
+            if ds.shape[0] != self.count:
+                ds.resize(self.count, axis=0)
+        self._vectors = {name: [] for name in self.hf["vectors"]}
+
+        encoding = self.hf.attrs.get("vector_encoding", "float32")
+        if encoding != self.vector_encoding:
+            raise ValueError(f"The file holds {encoding} vectors, not {self.vector_encoding}")
+        if "vector_block_starts" in self.hf:
+            # Drop the scales of blocks whose rows were truncated away
+            block_starts = self.hf["vector_block_starts"]
+            n_blocks = int(np.searchsorted(block_starts[()], self.count, side="left"))
+            for ds in [block_starts, *self.hf["vector_scales"].values()]:
+                ds.resize(n_blocks, axis=0)
+
+    def _create_datasets(self, dims: Dict[str, int], with_update_times: bool) -> None:
+        str_dtype = h5py.string_dtype(encoding="utf-8")
+        kwargs = dict(chunks=(self.chunk_rows,), compression=self.compression)
+        self.hf.create_dataset("uuids", shape=(0,), maxshape=(None,), dtype=str_dtype, **kwargs)
+        self.hf.create_dataset("properties", shape=(0,), maxshape=(None,), dtype=str_dtype, **kwargs)
+        if with_update_times:
+            self.hf.create_dataset("update_times", shape=(0,), maxshape=(None,), dtype=np.int64, **kwargs)
+        self.hf.attrs["vector_encoding"] = self.vector_encoding
+        dtype = np.dtype(self.vector_encoding)
+        vectors = self.hf.create_group("vectors")
+        for name, dim in dims.items():
+            vectors.create_dataset(
+                name,
+                shape=(0, dim),
+                maxshape=(None, dim),
+                dtype=dtype,
+                chunks=(_vector_chunk_rows(self.chunk_rows, dim, dtype.itemsize), dim),
+                compression=self.compression,
+            )
+        if self.vector_encoding == "int8":
+            self.hf.create_dataset("vector_block_starts", shape=(0,), maxshape=(None,), dtype=np.int64)
+            scales = self.hf.create_group("vector_scales")
+            for name, dim in dims.items():
+                scales.create_dataset(name, shape=(0, dim), maxshape=(None, dim), dtype=np.float32)
+
+    def add_object(
+        self,
+        uuid: str,
+        properties: Dict[str, Any],
+        vectors: Dict[str, Any],
+        update_time_ms: Optional[int] = None,
+    ) -> None:
+        """`update_time_ms` (the object's last update time, in unix ms) is stored if given for every object."""
+        if self._vectors and set(vectors) != set(self._vectors):
+            raise ValueError(
+                f"Object {uuid} has vectors {sorted(vectors)}, expected {sorted(self._vectors)}"
+            )
+        if update_time_ms is not None:
+            self._update_times.append(update_time_ms)
+        self._uuids.append(str(uuid))
+        self._properties.append(json.dumps(properties, cls=DateTimeEncoder))
+        for name, v in vectors.items():
+            self._vectors.setdefault(name, []).append(np.asarray(v, dtype=np.float32))
+        if len(self._uuids) >= self.chunk_rows:
+            self.flush()
+
+    def _append(self, uuids, properties, vectors: Dict[str, np.ndarray], update_times=None) -> None:
+        # Write columns (encoded, except for float32 vectors) after the current end of the datasets
+        if "uuids" not in self.hf:
+            self._create_datasets(
+                {name: v.shape[1] for name, v in vectors.items()}, update_times is not None
+            )
+        if (update_times is not None) != ("update_times" in self.hf):
+            raise ValueError("Update times must be given for all objects of a file, or for none")
+
+        start, stop = self.count, self.count + len(uuids)
+        columns = [("uuids", uuids), ("properties", properties)]
+        if update_times is not None:
+            columns.append(("update_times", update_times))
+        for name, data in columns:
+            self.hf[name].resize((stop,))
+            self.hf[name][start:stop] = data
+        if self.vector_encoding == "int8":
+            block_starts = self.hf["vector_block_starts"]
+            block_starts.resize((block_starts.shape[0] + 1,))
+            block_starts[-1] = start
+        for name, data in vectors.items():
+            encoded, scales = encode_vectors(data, self.vector_encoding)
+            if self.vector_encoding != "float32":
+                self._record_error(name, data, decode_vectors(encoded, scales))
+            if scales is not None:
+                scales_ds = self.hf["vector_scales"][name]
+                scales_ds.resize((scales_ds.shape[0] + 1, scales_ds.shape[1]))
+                scales_ds[-1] = scales
+            ds = self.hf["vectors"][name]
+            ds.resize((stop, ds.shape[1]))
+            ds[start:stop] = encoded
+
+        self.count = stop
+        self.hf.attrs["count"] = self.count
+        self.hf.flush()
+
+    def flush(self) -> None:
+        if not self._uuids:
+            return
+        if self._update_times and len(self._update_times) != len(self._uuids):
+            raise ValueError("Update times must be given for all objects of a file, or for none")
+        self._append(
+            self._uuids,
+            self._properties,
+            {name: np.stack(rows) for name, rows in self._vectors.items()},
+            self._update_times or None,
+        )
+        self._uuids, self._properties, self._update_times = [], [], []
+        self._vectors = {name: [] for name in self._vectors}
+
+    def _record_error(self, name: str, original: np.ndarray, decoded: np.ndarray) -> None:
+        errors = 1 - cosine_similarities(np.asarray(original, dtype=np.float32), decoded)
+        stats = self._errors.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += len(errors)
+        stats[1] += float(errors.sum())
+        stats[2] = max(stats[2], float(errors.max()))
+
+    def encoding_report(self) -> Dict[str, Dict[str, float]]:
+        """Cosine error introduced by the vector encoding so far, per vector name."""
+        return {
+            name: {"mean_cosine_error": total / n if n else 0.0, "max_cosine_error": worst}
+            for name, (n, total, worst) in self._errors.items()
+        }
+
+    def append_rows(self, source: h5py.File, start: int = 0, stop: Optional[int] = None) -> None:
+        """
+        Copy rows `[start, stop)` of another columnar file, without decoding their properties.
+
+        Used to assemble one export file from several partial ones.
+        """
+        self.flush()
+        reader = ExportReader(source)
+        stop = len(reader) if stop is None else stop
+        if stop <= start:
+            return
+        if self._vectors and set(source["vectors"]) != set(self._vectors):
+            raise ValueError(
+                f"Source has vectors {sorted(source['vectors'])}, expected {sorted(self._vectors)}"
+            )
+        self._vectors = {name: [] for name in source["vectors"]}
+        for block_start in range(start, stop, self.chunk_rows):
+            block_stop = min(block_start + self.chunk_rows, stop)
+            self._append(
+                source["uuids"][block_start:block_stop],
+                source["properties"][block_start:block_stop],
+                {name: reader.read_vectors(name, block_start, block_stop) for name in source["vectors"]},
+                source["update_times"][block_start:block_stop] if "update_times" in source else None,
+            )
+
+    def close(self) -> None:
+        self.flush()
+        self.hf.attrs["count"] = self.count
+        for name, report in self.encoding_report().items():
+            self.hf["vectors"][name].attrs.update(report)
+
+    def __enter__(self) -> "ColumnarWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+
+
+@dataclass
+class Watermark:
+    """
+    The collection state an export file reflects, for incremental (delta) exports.
+
+    A delta file holds the objects created or updated since its base's watermark,
+    plus the UUIDs deleted since. It applies on top of a collection whose UUID set
+    hashes to `base_uuid_set_hash`.
+    """
+
+    last_update_time_ms: int  # Latest object creation/update time, in unix ms
+    uuid_set_hash: str  # Hash of the collection's UUID set, once this file is applied
+    base_uuid_set_hash: Optional[str] = None  # Delta files only
+
+    @property
+    def is_delta(self) -> bool:
+        return self.base_uuid_set_hash is not None
+
+
+def write_watermark(
+    hf: h5py.File,
+    watermark: Watermark,
+    uuid_set: np.ndarray,
+    deleted_uuids: Sequence[str] = (),
+) -> None:
+    """
+    Record `watermark` in an export file, with the full UUID set it was computed
+    from (as a sorted `(N, 16)` uint8 array) and, for deltas, the deleted UUIDs.
+    """
+    hf.attrs["watermark_last_update_time_ms"] = watermark.last_update_time_ms
+    hf.attrs["watermark_uuid_set_hash"] = watermark.uuid_set_hash
+    hf.create_dataset(
+        "uuid_set", data=uuid_set, dtype=np.uint8, compression="gzip" if len(uuid_set) else None
+    )
+    if watermark.is_delta:
+        hf.attrs["watermark_base_uuid_set_hash"] = watermark.base_uuid_set_hash
+        hf.create_dataset(
+            "deleted_uuids",
+            data=np.array(list(deleted_uuids), dtype=object),
+            dtype=h5py.string_dtype(encoding="utf-8"),
+        )
+
+
+def read_watermark(hf: h5py.File) -> Optional[Watermark]:
+    """The file's watermark, or None for files exported without one."""
+    if "watermark_uuid_set_hash" not in hf.attrs:
+        return None
+    base = hf.attrs.get("watermark_base_uuid_set_hash")
+    return Watermark(
+        last_update_time_ms=int(hf.attrs["watermark_last_update_time_ms"]),
+        uuid_set_hash=str(hf.attrs["watermark_uuid_set_hash"]),
+        base_uuid_set_hash=str(base) if base is not None else None,
+    )
+
+
+def read_uuid_set(hf: h5py.File) -> np.ndarray:
+    return hf["uuid_set"][()]
+
+
+def read_deleted_uuids(hf: h5py.File) -> List[str]:
+    if "deleted_uuids" not in hf:
+        return []
+    return [u.decode() if isinstance(u, bytes) else u for u in hf["deleted_uuids"][()]]
+
+
+class ExportReader:
+    """
+    Read objects from an HDF5 export file, in blocks.
+
+    Auto-detects the file layout. Columnar (v2) files are read in large slices;
+    legacy (v1) per-group files are read group by group, in sorted key order.
+    """
+
+    def __init__(self, hf: h5py.File):
+        self.hf = hf
+        self.format_version = get_format_version(hf)
+        if self.format_version == LEGACY_FORMAT_VERSION:
+            self._keys = list(hf.keys())
+        else:
+            self._keys = None
+        self.vector_encoding = str(hf.attrs.get("vector_encoding", "float32"))
+        self._scales: Dict[str, np.ndarray] = {}  # Loaded on first use; one row per block
+        self._block_starts: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        if self._keys is not None:
+            return len(self._keys)
+        if "uuids" not in self.hf:  # Nothing was written
+            return 0
+        return self.hf["uuids"].shape[0]
+
+    def read_block(self, start: int, stop: int) -> ObjectBlock:
+        stop = min(stop, len(self))
+        if self._keys is not None:
+            return self._read_legacy_block(start, stop)
+
+        uuids = [u.decode() if isinstance(u, bytes) else u for u in self.hf["uuids"][start:stop]]
+        properties = [json.loads(p) for p in self.hf["properties"][start:stop]]
+        vectors = {name: self.read_vectors(name, start, stop) for name in self.hf["vectors"]}
+        return ObjectBlock(uuids=uuids, properties=properties, vectors=vectors)
+
+    def read_vectors(self, name: str, start: int, stop: int) -> np.ndarray:
+        """float32 vectors `[start, stop)` of a columnar file, decoded in one vectorized step."""
+        data = self.hf["vectors"][name][start:stop]
+        if self.vector_encoding != "int8":
+            return decode_vectors(data)
+        if name not in self._scales:
+            self._scales[name] = self.hf["vector_scales"][name][()]
+            self._block_starts = self.hf["vector_block_starts"][()]
+        rows = np.arange(start, start + len(data))
+        blocks = np.searchsorted(self._block_starts, rows, side="right") - 1
+        return decode_vectors(data, self._scales[name][blocks])
+
+    def _read_legacy_block(self, start: int, stop: int) -> ObjectBlock:
+        uuids = self._keys[start:stop]
+        properties = []
+        vectors: Dict[str, List[np.ndarray]] = {}
+        for uuid in uuids:
+            group = self.hf[uuid]
+            properties.append(json.loads(group["object"][()]))
+            for key in group.keys():
+                if key.startswith("vector_"):
+                    vector_name = key.split("_", 1)[1]
+                    vectors.setdefault(vector_name, []).append(np.asarray(group[key]))
+        return ObjectBlock(
+            uuids=uuids,
+            properties=properties,
+            vectors={k: np.stack(v) for k, v in vectors.items()},
+        )
+
+    def iter_blocks(
+        self, start: int = 0, stop: Optional[int] = None, block_size: int = DEFAULT_CHUNK_ROWS
+    ) -> Iterator[ObjectBlock]:
+        stop = len(self) if stop is None else min(stop, len(self))
+        for block_start in range(start, stop, block_size):
+            yield self.read_block(block_start, min(block_start + block_size, stop))
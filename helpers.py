@@ -4,33 +4,72 @@ from enum import Enum
 from datasets import load_dataset
 from datetime import datetime
 from dateutil import parser
-from typing import Dict, Union, List, Any, Literal, Optional
-from collections.abc import Iterator
+from typing import Dict, Union, List, Any, Literal, Optional, Set, Sequence, Tuple
+from collections.abc import Iterator, Iterable
+from pathlib import Path
+from uuid import UUID
 import claudette
+import anthropic
 from anthropic.types import Message
 import ollama
-import subprocess
+import asyncio
+import hashlib
+import time
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import weaviate
-from weaviate import WeaviateClient
-from weaviate.collections import Collection
-from weaviate.classes.query import Metrics, Filter
+from weaviate import WeaviateClient, WeaviateAsyncClient
+from weaviate.collections import Collection, CollectionAsync
+from weaviate.classes.query import Metrics, Filter, MetadataQuery
 import os
 
 
+DATASET_NAME = "Rakuto/twitter_customer_support_dialogue"
+DATASET_COLUMNS = ["text", "dialogue_id", "company_author", "created_at"]
+# e.g. "Tue Oct 31 22:10:47 +0000 2017"
+DATASET_TIME_FORMAT = "%a %b %d %H:%M:%S %z %Y"
+
+
 class CollectionName(str, Enum):
     """Enum for Weaviate collection names."""
 
     SUPPORTCHAT = "SupportChat"
 
 
+def _api_key_headers() -> Dict[str, str]:
+    return {
+        "X-ANTHROPIC-API-KEY": os.environ["ANTHROPIC_API_KEY"],
+        "X-OPENAI-API-KEY": os.environ["OPENAI_API_KEY"],
+        "X-COHERE-API-KEY": os.environ["COHERE_API_KEY"],
+    }
+
+
 def connect_to_weaviate() -> WeaviateClient:
     client = weaviate.connect_to_local(
         port=80,
-        headers={
-            "X-ANTHROPIC-API-KEY": os.environ["ANTHROPIC_API_KEY"],
-            "X-OPENAI-API-KEY": os.environ["OPENAI_API_KEY"],
-            "X-COHERE-API-KEY": os.environ["COHERE_API_KEY"],
-        },
+        headers=_api_key_headers(),
+    )
+    return client
+
+
+def connect_to_weaviate_node(host: str, port: int, grpc_port: int) -> WeaviateClient:
+    # A specific node, e.g. one of those in `docker-compose-three-nodes.yml`
+    client = weaviate.connect_to_local(
+        host=host,
+        port=port,
+        grpc_port=grpc_port,
+        headers=_api_key_headers(),
+    )
+    return client
+
+
+def connect_to_weaviate_async() -> WeaviateAsyncClient:
+    # Not connected yet: use with `async with` (or `await client.connect()`)
+    client = weaviate.use_async_with_local(
+        port=80,
+        headers=_api_key_headers(),
     )
     return client
 
@@ -47,17 +86,198 @@ def _parse_time(time_string: str) -> datetime:
     return dt
 
 
+def _read_source_batches(
+    source: Optional[Union[str, Path]], batch_size: int
+) -> Iterator[pa.RecordBatch]:
+    if source is None:
+        # The Hugging Face cache is memory-mapped Arrow, so reading it in slices keeps memory flat
+        ds = load_dataset(DATASET_NAME, split="train").select_columns(DATASET_COLUMNS)
+        for table in ds.with_format("arrow").iter(batch_size=batch_size):
+            yield from table.to_batches()
+        return
+
+    source = Path(source)
+    if source.suffix == ".parquet":
+        yield from pq.ParquetFile(source).iter_batches(
+            batch_size=batch_size, columns=DATASET_COLUMNS
+        )
+    elif source.suffix in (".arrow", ".feather", ".ipc"):
+        with pa.memory_map(str(source)) as f:
+            try:
+                reader = pa.ipc.open_file(f)
+                batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+            except pa.ArrowInvalid:
+                f.seek(0)
+                batches = pa.ipc.open_stream(f)  # e.g. Hugging Face cache files
+            for batch in batches:
+                yield from pa.Table.from_batches([batch]).select(DATASET_COLUMNS).to_batches(
+                    max_chunksize=batch_size
+                )
+    else:
+        raise ValueError(f"Unsupported data file type: {source}")
+
+
+def _parse_time_column(times: pa.Array) -> pa.Array:
+    parsed = pc.strptime(times, format=DATASET_TIME_FORMAT, unit="s", error_is_null=True)
+    # Fall back to dateutil only for the (rare) values not in the expected format
+    failed = pc.and_(pc.is_null(parsed), pc.is_valid(times))
+    if pc.any(failed).as_py():
+        values = parsed.to_pylist()
+        for i in np.flatnonzero(failed.to_numpy(zero_copy_only=False)):
+            values[i] = _parse_time(times[i].as_py())
+        parsed = pa.array(values, type=parsed.type)
+    return parsed
+
+
+def _iter_batches(
+    max_text_length: int, source: Optional[Union[str, Path]], batch_size: int
+) -> Iterator[Tuple[pa.RecordBatch, pa.Array]]:
+    # Converted batches, with the raw `created_at` strings
+    for batch in _read_source_batches(source, batch_size):
+        times = batch.column("created_at")
+        converted = pa.RecordBatch.from_arrays(
+            [
+                pc.utf8_slice_codeunits(batch.column("text"), 0, max_text_length),
+                batch.column("dialogue_id"),
+                batch.column("company_author"),
+                _parse_time_column(times),
+            ],
+            names=DATASET_COLUMNS,
+        )
+        yield converted, times
+
+
+def get_data_record_batches(
+    max_text_length: int = 10**5,
+    source: Optional[Union[str, Path]] = None,
+    batch_size: int = 10000,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Stream the dataset as Arrow record batches, with the same columns as `get_data_objects`.
+
+    Texts are truncated and timestamps parsed per batch with pyarrow compute.
+    `source` can be a local Parquet or Arrow file, to load the data offline;
+    by default the dataset is read from Hugging Face.
+    Timestamps are tz-aware UTC Arrow timestamps; use `get_data_objects` for
+    rows that are identical to the dateutil-parsed ones (e.g. for `generate_uuid5`).
+    """
+    for batch, _ in _iter_batches(max_text_length, source, batch_size):
+        yield batch
+
+
+def _to_datetimes(parsed: pa.Array, times: pa.Array) -> List[Optional[datetime]]:
+    # The same datetimes `_parse_time` returns, incl. the tzinfo (which is part of
+    # `generate_uuid5`'s input): dateutil's tzinfo for "+0000" depends on the local
+    # timezone, so ask it once. Other offsets (not in the dataset) are parsed with dateutil.
+    utc = _parse_time("Thu Jan 01 00:00:00 +0000 1970").tzinfo
+    naive = parsed.cast(pa.timestamp("s")).to_pylist()
+    is_utc = pc.fill_null(pc.match_substring(times, " +0000 "), False).to_pylist()
+    for i, dt in enumerate(naive):
+        if is_utc[i]:
+            naive[i] = dt.replace(tzinfo=utc)
+        elif times[i].is_valid:
+            naive[i] = _parse_time(times[i].as_py())
+    return naive
+
+
 def get_data_objects(
     max_text_length: int = 10**5,
+    source: Optional[Union[str, Path]] = None,
+    batch_size: int = 10000,
 ) -> Iterator[Dict[str, Union[datetime, str, int]]]:
-    ds = load_dataset("Rakuto/twitter_customer_support_dialogue")["train"]
-    for item in ds:
-        yield {
-            "text": item["text"][:max_text_length],
-            "dialogue_id": item["dialogue_id"],
-            "company_author": item["company_author"],
-            "created_at": _parse_time(item["created_at"]),
-        }
+    """
+    Stream the dataset as dicts, e.g. to import or to `generate_uuid5` from.
+
+    Converted from `get_data_record_batches`' batches, so texts & timestamps are
+    processed in bulk; values are identical to parsing each row with dateutil.
+    """
+    for batch, times in _iter_batches(max_text_length, source, batch_size):
+        columns = [batch.column(name).to_pylist() for name in DATASET_COLUMNS[:-1]]
+        columns.append(_to_datetimes(batch.column("created_at"), times))
+        for values in zip(*columns):
+            yield dict(zip(DATASET_COLUMNS, values))
+
+
+def uuid_key(uuid: Union[str, UUID]) -> bytes:
+    """Compact (16-byte) key for a UUID, for use in a `UUIDIndex`."""
+    if isinstance(uuid, str):
+        uuid = UUID(uuid)
+    return uuid.bytes
+
+
+class UUIDIndex:
+    """
+    Local set of object UUIDs in a collection, to check existence without a request per object.
+
+    Can be built by streaming the collection once, and persisted to disk
+    (as an `(N, 16)` uint8 array) so that the next run can start from it.
+    """
+
+    def __init__(self, keys: Optional[Iterable[bytes]] = None):
+        self.keys: Set[bytes] = set(keys) if keys is not None else set()
+
+    def __contains__(self, uuid: Union[str, UUID, bytes]) -> bool:
+        key = uuid if isinstance(uuid, bytes) else uuid_key(uuid)
+        return key in self.keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, uuid: Union[str, UUID, bytes]) -> None:
+        self.keys.add(uuid if isinstance(uuid, bytes) else uuid_key(uuid))
+
+    def discard(self, uuid: Union[str, UUID, bytes]) -> None:
+        self.keys.discard(uuid if isinstance(uuid, bytes) else uuid_key(uuid))
+
+    def to_array(self) -> np.ndarray:
+        """Keys as a sorted `(N, 16)` uint8 array."""
+        return np.frombuffer(b"".join(sorted(self.keys)), dtype=np.uint8).reshape(-1, 16)
+
+    def digest(self) -> str:
+        """Hash of the UUID set; equal sets give equal digests, whatever the insertion order."""
+        return hashlib.sha256(self.to_array().tobytes()).hexdigest()
+
+    @classmethod
+    def from_array(cls, arr: np.ndarray) -> "UUIDIndex":
+        return cls(row.tobytes() for row in arr)
+
+    @classmethod
+    def from_collection(cls, collection: Collection) -> "UUIDIndex":
+        # Only the UUIDs are needed, so skip properties & vectors
+        return cls(
+            obj.uuid.bytes for obj in collection.iterator(return_properties=[])
+        )
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "UUIDIndex":
+        return cls.from_array(np.load(path))
+
+    def save(self, path: Union[str, Path]) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.save(path, self.to_array())
+
+
+def iter_update_times(collection: Collection) -> Iterator[tuple]:
+    """Yield `(uuid, last update time in unix ms)` for every object, without properties or vectors."""
+    for obj in collection.iterator(
+        return_properties=[], return_metadata=MetadataQuery(last_update_time=True)
+    ):
+        yield obj.uuid, int(obj.metadata.last_update_time.timestamp() * 1000)
+
+
+def load_or_build_uuid_index(
+    collection: Collection, path: Optional[Union[str, Path]] = None
+) -> UUIDIndex:
+    """
+    Load a persisted UUID index if it still matches the collection's object count,
+    otherwise stream the collection once to rebuild it.
+    """
+    if path is not None and Path(path).exists():
+        index = UUIDIndex.load(path)
+        if len(index) == len(collection):
+            return index
+        print(f"UUID index at {path} is stale; rebuilding from the collection.")
+    return UUIDIndex.from_collection(collection)
 
 
 def get_top_companies(collection: Collection):
@@ -69,6 +289,28 @@ def get_top_companies(collection: Collection):
     return response.properties["company_author"].top_occurrences
 
 
+SEARCH_TYPE_ALPHAS = {"Hybrid": 0.5, "Vector": 1, "Keyword": 0}
+TARGET_VECTORS = ["text", "text_with_metadata"]
+
+
+def _company_filter(company_filter: str):
+    if company_filter:
+        return Filter.by_property("company_author").like(company_filter)
+    return None
+
+
+def _embed_query(embedder: Optional[Any], query: str) -> Optional[List[float]]:
+    if embedder is None:
+        return None
+    try:
+        # `embed` is all the `Embedder` protocol guarantees
+        return embedder.embed([query])[0].tolist()
+    except Exception as e:
+        # Weaviate can still vectorize the query itself
+        print(f"Client-side query embedding failed, falling back to Weaviate: {e}")
+        return None
+
+
 def weaviate_query(
     collection: Collection,
     query: str,
@@ -76,23 +318,25 @@ def weaviate_query(
     limit: int,
     search_type: Literal["Hybrid", "Vector", "Keyword"],
     rag_query: Optional[str] = None,
+    embedder: Optional[Any] = None,
 ):
-    if company_filter:
-        company_filter_obj = Filter.by_property("company_author").like(company_filter)
-    else:
-        company_filter_obj = None
+    """
+    Hybrid search (optionally with grouped-task generation) on the `text_with_metadata` vector.
 
-    if search_type == "Hybrid":
-        alpha = 0.5
-    elif search_type == "Vector":
-        alpha = 1
-    elif search_type == "Keyword":
-        alpha = 0
+    With an `embedder` (e.g. `embeddings.CachedEmbedder`), the query is vectorized
+    client-side, so Weaviate does not call the model provider for it.
+    """
+    company_filter_obj = _company_filter(company_filter)
+    alpha = SEARCH_TYPE_ALPHAS[search_type]
 
+    query_vector = None
+    if alpha > 0:
+        query_vector = _embed_query(embedder, query)
 
     if rag_query:
         search_response = collection.generate.hybrid(
             query=query,
+            vector=query_vector,
             target_vector="text_with_metadata",
             filters=company_filter_obj,
             alpha=alpha,
@@ -102,6 +346,7 @@ def weaviate_query(
     else:
         search_response = collection.query.hybrid(
             query=query,
+            vector=query_vector,
             target_vector="text_with_metadata",
             filters=company_filter_obj,
             alpha=alpha,
@@ -110,33 +355,127 @@ def weaviate_query(
     return search_response
 
 
-def get_pprof_results() -> str:
-    return subprocess.run(
-        ["go", "tool", "pprof", "-top", "http://localhost:6060/debug/pprof/heap"],
-        capture_output=True,
-        text=True,
-        timeout=10,
+async def weaviate_query_async(
+    collection: CollectionAsync,
+    query: str,
+    company_filter: str,
+    limit: int,
+    search_type: Literal["Hybrid", "Vector", "Keyword"],
+    target_vector: str = "text_with_metadata",
+    query_vector: Optional[List[float]] = None,
+    timeout: Optional[float] = None,
+):
+    """Async equivalent of `weaviate_query` (search only), with a timeout in seconds."""
+    alpha = SEARCH_TYPE_ALPHAS[search_type]
+    return await asyncio.wait_for(
+        collection.query.hybrid(
+            query=query,
+            vector=query_vector if alpha > 0 else None,
+            target_vector=target_vector,
+            filters=_company_filter(company_filter),
+            alpha=alpha,
+            limit=limit,
+        ),
+        timeout=timeout,
     )
 
 
-def manual_rag(
-    rag_query: str, context: str, provider: Literal["claude", "ollama"]
-) -> List[str]:
-    prompt = f"""
+async def weaviate_query_fanout(
+    collection: CollectionAsync,
+    query: str,
+    company_filter: str,
+    limit: int,
+    search_types: Sequence[str] = tuple(SEARCH_TYPE_ALPHAS),
+    target_vectors: Sequence[str] = tuple(TARGET_VECTORS),
+    timeout: Optional[float] = 5,
+    embedder: Optional[Any] = None,
+) -> Dict[tuple, Any]:
+    """
+    Run each combination of search type & target vector concurrently.
+
+    Returns `{(search_type, target_vector): response}`. A combination that failed
+    or took longer than `timeout` seconds (and was cancelled) maps to its exception
+    instead, so one slow search doesn't hold back the others' results.
+    An `embedder` is only used for the `text_with_metadata` vector, as it must
+    match the collection's vectorizer for that vector.
+    """
+    query_vector = None
+    if embedder is not None and "text_with_metadata" in target_vectors:
+        query_vector = await asyncio.to_thread(_embed_query, embedder, query)
+
+    keys = [(st, tv) for st in search_types for tv in target_vectors]
+    results = await asyncio.gather(
+        *[
+            weaviate_query_async(
+                collection,
+                query,
+                company_filter,
+                limit,
+                st,
+                target_vector=tv,
+                query_vector=query_vector if tv == "text_with_metadata" else None,
+                timeout=timeout,
+            )
+            for st, tv in keys
+        ],
+        return_exceptions=True,
+    )
+    return dict(zip(keys, results))
+
+
+def run_query_fanout(
+    async_connections,
+    collection_name: str,
+    query: str,
+    company_filter: str,
+    limit: int,
+    **kwargs,
+) -> Dict[tuple, Any]:
+    """
+    Synchronous entry point for `weaviate_query_fanout`.
+
+    Runs on the shared async client of `async_connections`
+    (a `connections.AsyncConnectionManager`), instead of connecting per call.
+    """
+
+    async def _run(client: WeaviateAsyncClient):
+        collection = client.collections.get(collection_name)
+        return await weaviate_query_fanout(collection, query, company_filter, limit, **kwargs)
+
+    return async_connections.run(_run)
+
+
+# Default generative models for client-side RAG
+DEFAULT_RAG_MODELS = {
+    "claude": "claude-3-haiku-20240307",  # e.g. "claude-3-haiku-20240307" or "claude-3-5-sonnet-20240620"
+    "ollama": "gemma2:2b",  # Pulled by `workshop_setup.py`
+}
+
+
+def _rag_prompt(rag_query: str, context: str) -> str:
+    return f"""
     Answer this query <query>{rag_query}</query>
     about these conversations between
     customer support people and customers: {context}
     """
+
+
+def manual_rag(
+    rag_query: str,
+    context: str,
+    provider: Literal["claude", "ollama"],
+    model: Optional[str] = None,
+) -> List[str]:
+    prompt = _rag_prompt(rag_query, context)
+    model = model or DEFAULT_RAG_MODELS[provider]
     if provider == "claude":
-        chat = claudette.Chat(
-            model="claude-3-haiku-20240307"  # e.g. "claude-3-haiku-20240307" or "claude-3-5-sonnet-20240620"
-        )
+        chat = claudette.Chat(model=model)
         r: Message = chat(prompt)
         rag_responses = [c.text for c in r.content]
         return rag_responses
     elif provider == "ollama":
         response = ollama.chat(
-            model="gemma2b:2b",
+            model=model,
             messages=[
                 {
                     "role": "user",
@@ -147,6 +486,94 @@ def manual_rag(
         return [(response["message"]["content"])]
 
 
+def manual_rag_stream(
+    rag_query: str,
+    context: str,
+    provider: Literal["claude", "ollama"],
+    model: Optional[str] = None,
+    max_tokens: int = 1024,
+) -> Iterator[str]:
+    """Like `manual_rag`, but yields the answer's text chunks as the model produces them."""
+    prompt = _rag_prompt(rag_query, context)
+    model = model or DEFAULT_RAG_MODELS[provider]
+    if provider == "claude":
+        # API key will be read from the environment variable ANTHROPIC_API_KEY
+        with anthropic.Anthropic().messages.stream(
+            model=model,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": prompt}],
+        ) as stream:
+            yield from stream.text_stream
+    elif provider == "ollama":
+        for chunk in ollama.chat(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+        ):
+            yield chunk["message"]["content"]
+    else:
+        raise ValueError(f"Unknown RAG provider: {provider}")
+
+
+def build_rag_context(objects: Sequence[Any], max_chars: int = 8000) -> str:
+    """
+    Context for `manual_rag` from retrieved objects (e.g. `search_response.objects`), in rank order.
+
+    Objects are added whole until `max_chars` is reached; the last one is truncated.
+    """
+    parts = []
+    remaining = max_chars
+    for o in objects:
+        part = (
+            f"<conversation company='{o.properties['company_author']}' "
+            f"created_at='{o.properties['created_at']}'>\n{o.properties['text']}\n</conversation>"
+        )
+        parts.append(part[:remaining])
+        remaining -= len(parts[-1])
+        if remaining <= 0:
+            break
+    return "\n".join(parts)
+
+
+def generate_from_objects(
+    rag_query: str,
+    objects: Sequence[Any],
+    provider: Literal["claude", "ollama"],
+    model: Optional[str] = None,
+    max_context_chars: int = 8000,
+    stream: bool = False,
+) -> Union[str, Iterator[str]]:
+    """
+    Generate a RAG answer client-side from already-retrieved objects, without searching again.
+
+    Provider, model & context size are independent of the collection's `generative_config`.
+    Returns the answer, or an iterator of text chunks if `stream` is set.
+    """
+    context = build_rag_context(objects, max_chars=max_context_chars)
+    if stream:
+        return manual_rag_stream(rag_query, context, provider, model=model)
+    return "\n".join(manual_rag(rag_query, context, provider, model=model))
+
+
+class TimedStream:
+    """Wraps a token stream, recording time-to-first-token and total time (in seconds)."""
+
+    def __init__(self, stream: Iterator[str]):
+        self._stream = stream
+        self.ttft: Optional[float] = None
+        self.total: Optional[float] = None
+        self.chunks = 0
+
+    def __iter__(self) -> Iterator[str]:
+        start = time.perf_counter()
+        for chunk in self._stream:
+            if self.ttft is None:
+                self.ttft = time.perf_counter() - start
+            self.chunks += 1
+            yield chunk
+        self.total = time.perf_counter() - start
+
+
 STREAMLIT_STYLING = """
 <style>
     .stHeader {
@@ -0,0 +1,428 @@
+from helpers import CollectionName, connect_to_weaviate, UUIDIndex
+from hdf5_io import ExportReader, read_watermark, read_deleted_uuids
+from weaviate.classes.query import Filter
+from concurrent.futures import ProcessPoolExecutor, Future
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Literal, Optional, Tuple, Iterator
+from tqdm import tqdm
+import multiprocessing
+import numpy as np
+import threading
+import h5py
+import queue
+import time
+
+
+# Each worker reports progress to the parent in steps of this many objects
+PROGRESS_STEP = 500
+
+# Number of decoded blocks the reader thread may run ahead of the batcher
+DEFAULT_PREFETCH_BLOCKS = 4
+
+
+@dataclass
+class BatchStrategy:
+    """Which client-side batching to use; see `collection.batch.*`."""
+
+    kind: Literal["fixed_size", "dynamic", "rate_limit"] = "fixed_size"
+    batch_size: int = 200  # fixed_size only
+    concurrent_requests: Optional[int] = None  # fixed_size only; client default if None
+    requests_per_minute: int = 4800  # rate_limit only
+
+    def open(self, collection):
+        if self.kind == "fixed_size":
+            kwargs = {"batch_size": self.batch_size}
+            if self.concurrent_requests is not None:
+                kwargs["concurrent_requests"] = self.concurrent_requests
+            return collection.batch.fixed_size(**kwargs)
+        if self.kind == "dynamic":
+            return collection.batch.dynamic()
+        if self.kind == "rate_limit":
+            return collection.batch.rate_limit(requests_per_minute=self.requests_per_minute)
+        raise ValueError(f"Unknown batching strategy: {self.kind}")
+
+    @property
+    def label(self) -> str:
+        if self.kind == "fixed_size":
+            return f"fixed_size(batch_size={self.batch_size}, concurrent_requests={self.concurrent_requests})"
+        if self.kind == "rate_limit":
+            return f"rate_limit(requests_per_minute={self.requests_per_minute})"
+        return self.kind
+
+
+@dataclass
+class PipelineStats:
+    """
+    Queue statistics of the read/send pipeline.
+
+    `reader_blocked_s` is time the reader spent waiting on a full queue (back-pressure:
+    the send side is the bottleneck); `sender_starved_s` is time the batcher spent
+    waiting on an empty queue (the read/decode side is the bottleneck).
+    """
+
+    blocks: int = 0
+    reader_busy_s: float = 0.0
+    reader_blocked_s: float = 0.0
+    sender_starved_s: float = 0.0
+    queue_depth_sum: int = 0
+    queue_depth_max: int = 0
+
+    @property
+    def mean_queue_depth(self) -> float:
+        return self.queue_depth_sum / self.blocks if self.blocks else 0.0
+
+    @property
+    def bottleneck(self) -> str:
+        if self.blocks == 0:
+            return "n/a"
+        if self.sender_starved_s > self.reader_blocked_s:
+            return "read/decode (I/O-bound)"
+        return "send (network-bound)"
+
+    def merge(self, other: "PipelineStats") -> None:
+        self.blocks += other.blocks
+        self.reader_busy_s += other.reader_busy_s
+        self.reader_blocked_s += other.reader_blocked_s
+        self.sender_starved_s += other.sender_starved_s
+        self.queue_depth_sum += other.queue_depth_sum
+        self.queue_depth_max = max(self.queue_depth_max, other.queue_depth_max)
+
+
+@dataclass
+class ImportReport:
+    """Merged outcome of an import run, across all shards."""
+
+    total: int = 0
+    imported: int = 0
+    failed_objects: List[Dict[str, Any]] = field(default_factory=list)
+    pipeline: PipelineStats = field(default_factory=PipelineStats)
+
+    def merge(self, other: "ImportReport") -> None:
+        self.total += other.total
+        self.imported += other.imported
+        self.failed_objects.extend(other.failed_objects)
+        self.pipeline.merge(other.pipeline)
+
+
+_END = object()
+
+
+class BlockPrefetcher:
+    """
+    Bounded producer/consumer stage between the HDF5 reader and the batcher.
+
+    A reader thread reads & decodes blocks of objects into a queue of at most
+    `prefetch` blocks, while the caller iterates over it and sends the objects.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        start: int,
+        stop: int,
+        prefetch: int = DEFAULT_PREFETCH_BLOCKS,
+    ):
+        self.file_path = file_path
+        self.start = start
+        self.stop = stop
+        self.stats = PipelineStats()
+        self._queue: queue.Queue = queue.Queue(maxsize=prefetch)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._read, daemon=True)
+
+    def _put(self, item) -> None:
+        t0 = time.perf_counter()
+        while not self._stop_event.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.stats.reader_blocked_s += time.perf_counter() - t0
+
+    def _read(self) -> None:
+        try:
+            with h5py.File(self.file_path, "r") as hf:
+                blocks = ExportReader(hf).iter_blocks(self.start, self.stop)
+                while not self._stop_event.is_set():
+                    t0 = time.perf_counter()
+                    block = next(blocks, None)
+                    if block is None:
+                        break
+                    rows = list(block.rows())  # Decode ahead of the batcher
+                    self.stats.reader_busy_s += time.perf_counter() - t0
+                    self._put(rows)
+        except BaseException as e:
+            self._put(e)
+        finally:
+            self._put(_END)
+
+    def __iter__(self) -> Iterator[List[tuple]]:
+        self._thread.start()
+        try:
+            while True:
+                t0 = time.perf_counter()
+                depth = self._queue.qsize()
+                item = self._queue.get()
+                self.stats.sender_starved_s += time.perf_counter() - t0
+                if item is _END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                self.stats.blocks += 1
+                self.stats.queue_depth_sum += depth
+                self.stats.queue_depth_max = max(self.stats.queue_depth_max, depth)
+                yield item
+        finally:
+            self._stop_event.set()
+            self._thread.join()
+
+
+def _read_serially(file_path: str, start: int, stop: int) -> Iterator[List[tuple]]:
+    with h5py.File(file_path, "r") as hf:
+        for block in ExportReader(hf).iter_blocks(start, stop):
+            yield list(block.rows())
+
+
+def _summarise_failures(failed_objects) -> List[Dict[str, Any]]:
+    # `ErrorObject`s hold the full batch object (incl. vectors); keep only what
+    # we need, so results are cheap to send back from a worker process.
+    return [
+        {
+            "uuid": str(
+                err.original_uuid
+                if err.original_uuid is not None
+                else err.object_.uuid
+            ),
+            "message": err.message,
+        }
+        for err in failed_objects
+    ]
+
+
+def shard_ranges(n_objects: int, n_shards: int) -> List[Tuple[int, int]]:
+    """Split `[0, n_objects)` into up to `n_shards` contiguous, near-equal ranges."""
+    n_shards = max(1, min(n_shards, n_objects))
+    bounds = np.linspace(0, n_objects, n_shards + 1, dtype=int)
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def count_objects(file_path: str) -> int:
+    with h5py.File(file_path, "r") as hf:
+        return len(ExportReader(hf))
+
+
+def import_range(
+    file_path: str,
+    start: int,
+    stop: int,
+    batch_size: int = 200,
+    progress_queue: Optional[Any] = None,
+    progress_bar: Optional[tqdm] = None,
+    prefetch: int = DEFAULT_PREFETCH_BLOCKS,
+    strategy: Optional[BatchStrategy] = None,
+    collection_name: str = CollectionName.SUPPORTCHAT,
+) -> ImportReport:
+    """
+    Import objects `[start, stop)` of an HDF5 export file, with a single client and batcher.
+
+    With `prefetch > 0`, blocks are read & decoded on a separate thread, overlapping with sending.
+    `strategy` overrides the default fixed-size batching with `batch_size`.
+    """
+    report = ImportReport()
+    pending = 0
+    strategy = strategy or BatchStrategy(batch_size=batch_size)
+
+    with connect_to_weaviate() as client:
+        chats = client.collections.get(collection_name)
+
+        if prefetch > 0:
+            prefetcher = BlockPrefetcher(file_path, start, stop, prefetch=prefetch)
+            blocks = iter(prefetcher)
+        else:
+            prefetcher = None
+            blocks = _read_serially(file_path, start, stop)
+
+        with strategy.open(chats) as batch:
+            for rows in blocks:
+                for uuid, properties, vectors in rows:
+                    batch.add_object(uuid=uuid, properties=properties, vector=vectors)
+                report.total += len(rows)
+
+                pending += len(rows)
+                if pending >= PROGRESS_STEP:
+                    if progress_queue is not None:
+                        progress_queue.put(pending)
+                    if progress_bar is not None:
+                        progress_bar.update(pending)
+                    pending = 0
+
+        if prefetcher is not None:
+            report.pipeline = prefetcher.stats
+
+        if progress_queue is not None and pending:
+            progress_queue.put(pending)
+        if progress_bar is not None and pending:
+            progress_bar.update(pending)
+
+        report.failed_objects = _summarise_failures(chats.batch.failed_objects)
+
+    report.imported = report.total - len(report.failed_objects)
+    return report
+
+
+def _drain(progress_queue, progress_bar: tqdm, timeout: float = 0.5) -> None:
+    try:
+        progress_bar.update(progress_queue.get(timeout=timeout))
+        while True:
+            progress_bar.update(progress_queue.get_nowait())
+    except queue.Empty:
+        pass
+
+
+def import_sharded(
+    file_path: str,
+    n_workers: int,
+    batch_size: int = 200,
+    prefetch: int = DEFAULT_PREFETCH_BLOCKS,
+) -> ImportReport:
+    """
+    Import an HDF5 export file with `n_workers` processes.
+
+    The object range is split into contiguous shards, and each worker process
+    opens its own Weaviate client & batcher for its shard. Progress and failed
+    objects from all workers are merged into one report.
+    """
+    n_objects = count_objects(file_path)
+    shards = shard_ranges(n_objects, n_workers)
+
+    report = ImportReport()
+    # gRPC channels do not survive a fork, so start workers from scratch
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Manager() as manager, tqdm(
+        total=n_objects, desc=f"Importing objects ({len(shards)} workers)"
+    ) as progress_bar:
+        progress_queue = manager.Queue()
+        with ProcessPoolExecutor(max_workers=len(shards), mp_context=ctx) as executor:
+            futures: List[Future] = [
+                executor.submit(
+                    import_range,
+                    file_path,
+                    start,
+                    stop,
+                    batch_size,
+                    progress_queue,
+                    prefetch=prefetch,
+                )
+                for start, stop in shards
+            ]
+            while not all(f.done() for f in futures):
+                _drain(progress_queue, progress_bar)
+            _drain(progress_queue, progress_bar, timeout=0)
+
+            for f in futures:
+                report.merge(f.result())
+
+    return report
+
+
+def import_from_hdf5(
+    file_path: str,
+    n_workers: int = 1,
+    batch_size: int = 200,
+    prefetch: int = DEFAULT_PREFETCH_BLOCKS,
+) -> ImportReport:
+    """Import an HDF5 export file, sharded across `n_workers` processes if more than one."""
+    if n_workers > 1:
+        return import_sharded(
+            file_path, n_workers=n_workers, batch_size=batch_size, prefetch=prefetch
+        )
+
+    n_objects = count_objects(file_path)
+    with tqdm(total=n_objects, desc="Importing objects") as progress_bar:
+        return import_range(
+            file_path, 0, n_objects, batch_size, progress_bar=progress_bar, prefetch=prefetch
+        )
+
+
+def delete_objects(uuids: List[str], batch_size: int = 1000) -> int:
+    """Delete objects by UUID; returns the number deleted."""
+    deleted = 0
+    with connect_to_weaviate() as client:
+        chats = client.collections.get(CollectionName.SUPPORTCHAT)
+        for i in range(0, len(uuids), batch_size):
+            result = chats.data.delete_many(
+                where=Filter.by_id().contains_any(uuids[i : i + batch_size])
+            )
+            deleted += result.successful
+    return deleted
+
+
+def apply_delta(file_path: str, n_workers: int = 1, verify: bool = True) -> ImportReport:
+    """
+    Apply a delta export file: delete the objects deleted since its base, and upsert the changed ones.
+
+    With `verify`, first checks that the collection's UUID set is the delta's base
+    (one scan of UUIDs only), so deltas can't be applied out of order.
+    """
+    with h5py.File(file_path, "r") as hf:
+        watermark = read_watermark(hf)
+        deleted_uuids = read_deleted_uuids(hf)
+    if watermark is None or not watermark.is_delta:
+        raise ValueError(f"{file_path} is not a delta export")
+
+    if verify:
+        with connect_to_weaviate() as client:
+            current = UUIDIndex.from_collection(client.collections.get(CollectionName.SUPPORTCHAT))
+        if current.digest() != watermark.base_uuid_set_hash:
+            raise ValueError(
+                f"The collection is not at the base state of {file_path}; "
+                "apply the earlier deltas first, or restore from a snapshot"
+            )
+
+    n_deleted = delete_objects(deleted_uuids)
+    print(f"Deleted {n_deleted} of {len(deleted_uuids)} objects")
+    # Adding an object with an existing UUID replaces it
+    return import_from_hdf5(file_path, n_workers=n_workers)
+
+
+def restore_from_exports(
+    base_path: str, delta_paths: List[str], n_workers: int = 1
+) -> ImportReport:
+    """
+    Import a full export, then apply delta exports on top of it, in order.
+
+    The chain is checked up front: each delta's base must be the state left by the previous file.
+    """
+    expected = None
+    for path in [base_path, *delta_paths]:
+        with h5py.File(path, "r") as hf:
+            watermark = read_watermark(hf)
+        if watermark is None:
+            raise ValueError(f"{path} has no watermark")
+        if path == base_path and watermark.is_delta:
+            raise ValueError(f"{base_path} is a delta export, not a full one")
+        if expected is not None and watermark.base_uuid_set_hash != expected:
+            raise ValueError(f"{path} does not apply on top of the previous file")
+        expected = watermark.uuid_set_hash
+
+    report = import_from_hdf5(base_path, n_workers=n_workers)
+    for path in delta_paths:
+        report.merge(apply_delta(path, n_workers=n_workers, verify=False))
+    return report
+
+
+def print_import_report(report: ImportReport) -> None:
+    print(f"Import completed. {report.imported} of {report.total} objects imported.")
+    stats = report.pipeline
+    if stats.blocks > 0:
+        print(
+            f"Pipeline: {stats.blocks} blocks, queue depth mean {stats.mean_queue_depth:.1f} / max {stats.queue_depth_max}; "
+            f"reader busy {stats.reader_busy_s:.1f}s, blocked {stats.reader_blocked_s:.1f}s; "
+            f"sender starved {stats.sender_starved_s:.1f}s -> bottleneck: {stats.bottleneck}"
+        )
+    if len(report.failed_objects) > 0:
+        print("*" * 80)
+        print(f"***** Failed to add {len(report.failed_objects)} objects *****")
+        print("*" * 80)
+        print(report.failed_objects[:3])
@@ -0,0 +1,235 @@
+from helpers import CollectionName
+from pprof_profile import Profile, fetch_profile, DEFAULT_HEAP_URL
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Callable, ContextManager, Sequence, Any
+from weaviate import WeaviateClient
+import numpy as np
+import threading
+import time
+
+
+class RingBuffer:
+    """
+    Fixed-size numpy ring buffer, readable as one contiguous array without copying.
+
+    Each value is written twice (at `i` and `i + capacity`), so the latest
+    `capacity` values always form one slice of the underlying array.
+    """
+
+    def __init__(self, capacity: int, dtype=np.float64):
+        self.capacity = capacity
+        self._data = np.full(2 * capacity, np.nan, dtype=dtype)
+        self._next = 0  # Position of the next write, in [0, capacity)
+        self._count = 0
+
+    def append(self, value) -> None:
+        self._data[self._next] = value
+        self._data[self._next + self.capacity] = value
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def view(self) -> np.ndarray:
+        """
+        Read-only view of the values, oldest first.
+
+        The view is live: once the buffer is full, the next append overwrites
+        its first (oldest) element. Copy it if it must stay consistent.
+        """
+        end = self._next + self.capacity
+        v = self._data[end - self._count : end]
+        v.flags.writeable = False
+        return v
+
+    def __len__(self) -> int:
+        return self._count
+
+
+@dataclass
+class ShardStat:
+    node: str
+    shard: str
+    object_count: int
+    vector_queue_length: int
+    indexing_status: str
+
+
+@dataclass
+class NodeStat:
+    name: str
+    status: str
+    object_count: int
+    shard_count: int
+    vector_queue_length: int
+
+
+@dataclass
+class ClusterSnapshot:
+    """Per-node & per-shard stats of one collection, from one verbose `cluster.nodes` call."""
+
+    nodes: List[NodeStat]
+    shards: List[ShardStat]
+    object_count: int  # Sum over shards, counting each replicated shard once
+    warnings: List[str] = field(default_factory=list)
+    taken_at: float = 0.0
+
+
+def _spread(values: Sequence[int]) -> float:
+    # Relative difference between the largest and smallest value
+    return (max(values) - min(values)) / max(values) if values and max(values) > 0 else 0.0
+
+
+def summarize_nodes(
+    nodes: Sequence[Any], imbalance_threshold: float = 0.1
+) -> ClusterSnapshot:
+    """
+    Summarize verbose node info (`client.cluster.nodes(collection=..., output="verbose")`).
+
+    Flags unhealthy nodes, shards still indexing, replicas of one shard whose object
+    counts differ by more than `imbalance_threshold`, and the same for node totals.
+    """
+    shards: List[ShardStat] = []
+    node_stats: List[NodeStat] = []
+    warnings: List[str] = []
+    for node in nodes:
+        node_shards = [
+            ShardStat(
+                node=node.name,
+                shard=s.name,
+                object_count=s.object_count,
+                vector_queue_length=s.vector_queue_length,
+                indexing_status=str(s.vector_indexing_status),
+            )
+            for s in (node.shards or [])
+        ]
+        shards.extend(node_shards)
+        node_stats.append(
+            NodeStat(
+                name=node.name,
+                status=str(node.status),
+                object_count=sum(s.object_count for s in node_shards),
+                shard_count=len(node_shards),
+                vector_queue_length=sum(s.vector_queue_length for s in node_shards),
+            )
+        )
+        if str(node.status) != "HEALTHY":
+            warnings.append(f"Node {node.name} is {node.status}")
+
+    replicas: Dict[str, List[ShardStat]] = {}
+    for s in shards:
+        replicas.setdefault(s.shard, []).append(s)
+        if s.indexing_status != "READY":
+            warnings.append(
+                f"Shard {s.shard} on {s.node} is {s.indexing_status} "
+                f"(vector queue: {s.vector_queue_length})"
+            )
+    for shard, stats in replicas.items():
+        spread = _spread([s.object_count for s in stats])
+        if len(stats) > 1 and spread > imbalance_threshold:
+            counts = ", ".join(f"{s.node}: {s.object_count}" for s in stats)
+            warnings.append(f"Replicas of shard {shard} differ by {spread:.0%} ({counts})")
+
+    node_spread = _spread([n.object_count for n in node_stats])
+    if len(node_stats) > 1 and node_spread > imbalance_threshold:
+        warnings.append(f"Object counts across nodes differ by {node_spread:.0%}")
+
+    return ClusterSnapshot(
+        nodes=node_stats,
+        shards=shards,
+        object_count=sum(max(s.object_count for s in stats) for stats in replicas.values()),
+        warnings=warnings,
+        taken_at=time.time(),
+    )
+
+
+class MetricsCollector:
+    """
+    One background sampler per app process, shared by all sessions.
+
+    Every `interval` seconds, records the Weaviate heap size (from the pprof endpoint),
+    object count & node count into ring buffers holding the last `retention` samples.
+    Sessions read the buffers (`series()`) instead of polling the cluster themselves.
+    Node & shard stats come from one verbose `cluster.nodes` call per sample (kept in
+    `latest_cluster`), whose per-shard counts are much cheaper than an aggregate query.
+    """
+
+    SERIES = ("time", "heap_mb", "object_count", "node_count")
+
+    def __init__(
+        self,
+        client: Callable[[], ContextManager[WeaviateClient]],
+        interval: float = 2,
+        retention: int = 300,
+        profile_url: str = DEFAULT_HEAP_URL,
+        collection_name: str = CollectionName.SUPPORTCHAT,
+        imbalance_threshold: float = 0.1,
+    ):
+        self.client = client  # e.g. `ConnectionManager.client`
+        self.interval = interval
+        self.retention = retention
+        self.profile_url = profile_url
+        self.collection_name = collection_name
+        self.imbalance_threshold = imbalance_threshold
+        self._buffers: Dict[str, RingBuffer] = {
+            name: RingBuffer(retention) for name in self.SERIES
+        }
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.latest_profile: Optional[Profile] = None
+        self.latest_cluster: Optional[ClusterSnapshot] = None
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    def _sample(self) -> Dict[str, float]:
+        sample = {"time": time.time(), "heap_mb": np.nan, "object_count": np.nan, "node_count": np.nan}
+        try:
+            self.latest_profile = fetch_profile(self.profile_url, timeout=self.interval * 2)
+            sample["heap_mb"] = self.latest_profile.totals()["inuse_space"] / 2**20
+        except Exception as e:
+            self._record_error(e)
+        try:
+            with self.client() as client:
+                nodes = client.cluster.nodes(collection=self.collection_name, output="verbose")
+            self.latest_cluster = summarize_nodes(nodes, self.imbalance_threshold)
+            sample["object_count"] = self.latest_cluster.object_count
+            sample["node_count"] = len(self.latest_cluster.nodes)
+        except Exception as e:
+            self._record_error(e)
+        return sample
+
+    def _record_error(self, e: Exception) -> None:
+        self.errors += 1
+        self.last_error = f"{type(e).__name__}: {e}"
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            started = time.monotonic()
+            sample = self._sample()
+            with self._lock:
+                for name, value in sample.items():
+                    self._buffers[name].append(value)
+            self._stop_event.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self) -> "MetricsCollector":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="metrics-collector", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def series(self) -> Dict[str, np.ndarray]:
+        """Read-only views of all series, oldest first (NaN where a sample failed)."""
+        with self._lock:
+            return {name: buf.view() for name, buf in self._buffers.items()}
+
+    def latest(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                name: (buf.view()[-1] if len(buf) else np.nan)
+                for name, buf in self._buffers.items()
+            }
@@ -0,0 +1,207 @@
+"""
+Pure-Python reader for Go pprof profiles (e.g. Weaviate's `/debug/pprof/heap`).
+
+Decodes the gzipped `profile.proto` protobuf directly, so no Go toolchain
+(`go tool pprof`) is needed. See
+https://github.com/google/pprof/blob/main/proto/profile.proto for the format.
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple, Union
+import requests
+import gzip
+
+
+DEFAULT_HEAP_URL = "http://localhost:6060/debug/pprof/heap"
+
+_VARINT, _I64, _LEN, _I32 = 0, 1, 2, 5
+
+
+def _read_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _fields(buf: bytes) -> Iterator[Tuple[int, int, Union[int, bytes]]]:
+    """Yield `(field number, wire type, value)` for each field of a protobuf message."""
+    pos, end = 0, len(buf)
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        number, wire_type = key >> 3, key & 0x7
+        if wire_type == _VARINT:
+            value, pos = _read_varint(buf, pos)
+        elif wire_type == _LEN:
+            length, pos = _read_varint(buf, pos)
+            value = buf[pos : pos + length]
+            pos += length
+        elif wire_type == _I64:
+            value = int.from_bytes(buf[pos : pos + 8], "little")
+            pos += 8
+        elif wire_type == _I32:
+            value = int.from_bytes(buf[pos : pos + 4], "little")
+            pos += 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        yield number, wire_type, value
+
+
+def _ints(wire_type: int, value: Union[int, bytes]) -> List[int]:
+    # Repeated integers may be packed (one LEN field) or not (one field per value)
+    if wire_type != _LEN:
+        return [value]
+    out, pos = [], 0
+    while pos < len(value):
+        v, pos = _read_varint(value, pos)
+        out.append(v)
+    return out
+
+
+def _signed(value: int) -> int:
+    # int64 values are encoded as 64-bit two's complement varints
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+@dataclass
+class FunctionStat:
+    name: str
+    flat: int
+    flat_pct: float
+    cum: int
+    cum_pct: float
+
+
+@dataclass
+class Profile:
+    """Decoded profile: sample values per sample type, with the function names of each stack."""
+
+    sample_types: List[Tuple[str, str]]  # (type, unit), e.g. ("inuse_space", "bytes")
+    # One entry per sample: (leaf-first function names, values per sample type)
+    samples: List[Tuple[List[str], List[int]]] = field(default_factory=list)
+    time_nanos: int = 0
+
+    def _index(self, sample_type: str) -> int:
+        for i, (name, _) in enumerate(self.sample_types):
+            if name == sample_type:
+                return i
+        raise KeyError(f"No sample type {sample_type!r} in {self.sample_types}")
+
+    def totals(self) -> Dict[str, int]:
+        """Sum of each sample type over all samples, e.g. `{"inuse_space": <bytes>, ...}`."""
+        sums = [0] * len(self.sample_types)
+        for _, values in self.samples:
+            for i, v in enumerate(values):
+                sums[i] += v
+        return {name: total for (name, _), total in zip(self.sample_types, sums)}
+
+    def top(self, n: int = 10, sample_type: str = "inuse_space") -> List[FunctionStat]:
+        """Top `n` functions by flat value of `sample_type`, like `go tool pprof -top`."""
+        idx = self._index(sample_type)
+        flat: Dict[str, int] = {}
+        cum: Dict[str, int] = {}
+        for functions, values in self.samples:
+            value = values[idx]
+            if not functions or value == 0:
+                continue
+            flat[functions[0]] = flat.get(functions[0], 0) + value
+            for name in set(functions):
+                cum[name] = cum.get(name, 0) + value
+        total = self.totals()[sample_type] or 1
+        ranked = sorted(flat.items(), key=lambda kv: kv[1], reverse=True)[:n]
+        return [
+            FunctionStat(
+                name=name,
+                flat=value,
+                flat_pct=100 * value / total,
+                cum=cum[name],
+                cum_pct=100 * cum[name] / total,
+            )
+            for name, value in ranked
+        ]
+
+
+def decode_profile(data: bytes) -> Profile:
+    """Decode a (optionally gzipped) `profile.proto` message."""
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+
+    strings: List[str] = []
+    raw_sample_types: List[bytes] = []
+    raw_samples: List[bytes] = []
+    functions: Dict[int, int] = {}  # function id -> name string index
+    locations: Dict[int, List[int]] = {}  # location id -> function ids (leaf/inlined first)
+    time_nanos = 0
+
+    for number, wire_type, value in _fields(data):
+        if number == 1:
+            raw_sample_types.append(value)
+        elif number == 2:
+            raw_samples.append(value)
+        elif number == 4:
+            loc_id, function_ids = 0, []
+            for n, _, v in _fields(value):
+                if n == 1:
+                    loc_id = v
+                elif n == 4:  # Line
+                    for ln, _, lv in _fields(v):
+                        if ln == 1:
+                            function_ids.append(lv)
+            locations[loc_id] = function_ids
+        elif number == 5:
+            func_id, name_idx = 0, 0
+            for n, _, v in _fields(value):
+                if n == 1:
+                    func_id = v
+                elif n == 2:
+                    name_idx = v
+            functions[func_id] = name_idx
+        elif number == 6:
+            strings.append(value.decode("utf-8", errors="replace"))
+        elif number == 9:
+            time_nanos = value
+
+    sample_types = []
+    for raw in raw_sample_types:
+        type_idx = unit_idx = 0
+        for n, _, v in _fields(raw):
+            if n == 1:
+                type_idx = v
+            elif n == 2:
+                unit_idx = v
+        sample_types.append((strings[type_idx], strings[unit_idx]))
+
+    profile = Profile(sample_types=sample_types, time_nanos=time_nanos)
+    for raw in raw_samples:
+        location_ids: List[int] = []
+        values: List[int] = []
+        for n, wt, v in _fields(raw):
+            if n == 1:
+                location_ids.extend(_ints(wt, v))
+            elif n == 2:
+                values.extend(_signed(x) for x in _ints(wt, v))
+        names = [
+            strings[functions[f]]
+            for loc in location_ids
+            for f in locations.get(loc, [])
+            if f in functions
+        ]
+        profile.samples.append((names, values))
+    return profile
+
+
+def load_profile(path: Union[str, Path]) -> Profile:
+    """Decode a stored profile file, e.g. a test fixture saved from `/debug/pprof/heap`."""
+    return decode_profile(Path(path).read_bytes())
+
+
+def fetch_profile(url: str = DEFAULT_HEAP_URL, timeout: float = 10) -> Profile:
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    return decode_profile(response.content)
+
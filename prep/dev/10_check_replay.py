@@ -0,0 +1,56 @@
+# File: ./10_check_replay.py
+from benchmarking import load_workload
+from pathlib import Path
+import subprocess
+import tempfile
+import click
+import json
+import sys
+import os
+
+
+@click.command()
+@click.option("--workload", default="prep/dev/workloads/support_queries.jsonl", help="Workload file (JSON Lines).")
+@click.option("--recording", default="prep/dev/workloads/support_queries.recording.jsonl", help="Recorded responses to replay.")
+@click.option("--n-requests", default=120, help="Number of requests to send.")
+@click.option("--speedup", default=10.0, help="Divide the recorded service times by this.")
+def check(workload, recording, n_requests, speedup):
+    """
+    Run `5_benchmark_queries.py --replay` against a recording, and check the report.
+
+    Needs no Weaviate instance, so it can run in CI: every request must succeed,
+    and every search type in the workload must be reported.
+    """
+    script = Path(__file__).resolve().with_name("5_benchmark_queries.py")
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "report.json")
+        subprocess.run(
+            [
+                sys.executable,
+                str(script),
+                "--workload", workload,
+                "--replay", recording,
+                "--n-requests", str(n_requests),
+                "--concurrency", "4",
+                "--speedup", str(speedup),
+                "--output", output,
+            ],
+            check=True,
+            env={**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")]))},
+        )
+        with open(output) as f:
+            report = json.load(f)
+
+    results = report["results"]
+    assert report["config"]["target"] == f"replay:{recording}", report["config"]
+    assert results["all"]["requests"] == n_requests, results["all"]
+    for label, stats in results.items():
+        assert stats["errors"] == 0, f"{label}: {stats['example_errors']}"
+        assert stats["latency"]["p50_ms"] > 0, f"{label}: {stats['latency']}"
+    labels = {q.label for q in load_workload(workload)}
+    assert labels <= set(results), f"Missing from the report: {labels - set(results)}"
+    print(f"OK: {n_requests} replayed requests, {len(labels)} search types, no errors")
+
+
+if __name__ == "__main__":
+    check()
@@ -0,0 +1,58 @@
+# File: ./11_check_pprof_profile.py
+from pprof_profile import load_profile
+from pathlib import Path
+import click
+import math
+import re
+
+
+_TOTAL = re.compile(r"of (\d+)B total")
+_ROW = re.compile(r"^\s*(\d+)B?\s+([\d.]+)%\s+[\d.]+%\s+(\d+)B?\s+([\d.]+)%\s+(\S.*)$")
+
+
+def parse_pprof_top(text: str):
+    """Total & `(name, flat, flat%, cum, cum%)` rows of `go tool pprof -top -unit=B` output."""
+    total, rows = None, []
+    for line in text.splitlines():
+        match = _TOTAL.search(line)
+        if match:
+            total = int(match.group(1))
+            continue
+        match = _ROW.match(line)
+        if match:
+            flat, flat_pct, cum, cum_pct, name = match.groups()
+            rows.append((name, int(flat), float(flat_pct), int(cum), float(cum_pct)))
+    return total, rows
+
+
+@click.command()
+@click.option("--fixtures", default="prep/dev/fixtures", help="Directory with heap.pb.gz & the expected pprof output.")
+def check(fixtures):
+    """
+    Check `pprof_profile` against `go tool pprof` on a stored heap profile.
+
+    The expected outputs were made with
+    `go tool pprof -top -unit=B -nodefraction=0 -sample_index=<type> heap.pb.gz`.
+    """
+    fixtures = Path(fixtures)
+    profile = load_profile(fixtures / "heap.pb.gz")
+    totals = profile.totals()
+
+    for sample_type in ["inuse_space", "alloc_space"]:
+        total, rows = parse_pprof_top((fixtures / f"heap.{sample_type}.top.txt").read_text())
+        assert totals[sample_type] == total, (sample_type, totals[sample_type], total)
+
+        # `top()` ranks functions by flat value, so compare the rows with a flat value
+        expected = [row for row in rows if row[1] > 0]
+        top = profile.top(len(rows), sample_type)
+        assert [f.name for f in top] == [row[0] for row in expected], (sample_type, top)
+        for f, (name, flat, flat_pct, cum, cum_pct) in zip(top, expected):
+            assert (f.flat, f.cum) == (flat, cum), (sample_type, f, flat, cum)
+            # pprof rounds percentages to 2 significant digits (at least)
+            assert math.isclose(f.flat_pct, flat_pct, rel_tol=0.01, abs_tol=0.005), (sample_type, f)
+            assert math.isclose(f.cum_pct, cum_pct, rel_tol=0.01, abs_tol=0.005), (sample_type, f)
+        print(f"OK: {sample_type} total {total} B, top {len(top)} functions match pprof")
+
+
+if __name__ == "__main__":
+    check()
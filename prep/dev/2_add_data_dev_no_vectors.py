@@ -1,5 +1,10 @@
 # File: ./2_add_data.py
-from helpers import CollectionName, get_data_objects, connect_to_weaviate
+from helpers import (
+    CollectionName,
+    get_data_objects,
+    connect_to_weaviate,
+    load_or_build_uuid_index,
+)
 from weaviate.util import generate_uuid5
 from tqdm import tqdm
 
@@ -11,20 +16,24 @@ chats = client.collections.get(CollectionName.SUPPORTCHAT)
 
 
 MAX_OBJECTS = 200000
+UUID_INDEX_PATH = "data/uuid_index_supportchat.npy"
+
+# Build (or load) a local set of existing UUIDs, instead of checking each object with a request
+existing_uuids = load_or_build_uuid_index(chats, UUID_INDEX_PATH)
+print(f"Found {len(existing_uuids)} existing objects")
 
 # Add objects to the collection
 counter = 0
 with chats.batch.rate_limit(requests_per_minute=4800) as batch:
     for obj in tqdm(get_data_objects(max_text_length=8000)):
-        uuid = generate_uuid5(obj)
+        uuid = generate_uuid5(obj)  # Generate a UUID based on the object's properties
 
-        if not chats.data.exists(uuid):
+        if uuid not in existing_uuids:
             batch.add_object(
                 properties=obj,
-                uuid=generate_uuid5(
-                    obj
-                ),  # Generate a UUID based on the object's properties
+                uuid=uuid,
             )
+            existing_uuids.add(uuid)
         counter += 1
 
         if counter >= MAX_OBJECTS:
@@ -42,4 +51,9 @@ if len(chats.batch.failed_objects) > 0:
     print("*" * 80)
     print(chats.batch.failed_objects[:3])
 
+# Persist the index for the next run, without the objects that failed to import
+for failed in chats.batch.failed_objects:
+    existing_uuids.discard(failed.object_.uuid)
+existing_uuids.save(UUID_INDEX_PATH)
+
 client.close()
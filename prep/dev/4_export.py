@@ -1,34 +1,104 @@
 # File: ./4_export.py
-from helpers import CollectionName, connect_to_weaviate
+from helpers import CollectionName, connect_to_weaviate, iter_update_times, UUIDIndex
+from hdf5_io import (
+    ColumnarWriter,
+    DateTimeEncoder,
+    ExportReader,
+    Watermark,
+    write_watermark,
+    read_watermark,
+    read_uuid_set,
+    VECTOR_ENCODINGS,
+    COLUMNAR_FORMAT_VERSION,
+    LEGACY_FORMAT_VERSION,
+)
+from weaviate.classes.query import Filter, MetadataQuery
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from uuid import UUID
 from tqdm import tqdm
 import numpy as np
+import threading
+import tempfile
+import click
 import h5py
 import json
-from datetime import datetime
 import os
 
 
-def export_to_hdf5(model_suffix: str, export_size_max: int):
+def _update_time_ms(wv_obj) -> int:
+    return int(wv_obj.metadata.last_update_time.timestamp() * 1000)
+
+
+def _encoding_suffix(vector_encoding: str) -> str:
+    return "" if vector_encoding == "float32" else f"_{vector_encoding}"
+
+
+def _print_encoding_report(writer: ColumnarWriter) -> None:
+    for name, report in writer.encoding_report().items():
+        print(
+            f"  {name} ({writer.vector_encoding}): mean cosine error {report['mean_cosine_error']:.2e}, "
+            f"max {report['max_cosine_error']:.2e}"
+        )
+
+
+def write_snapshot_watermark(hf: h5py.File) -> None:
+    """Record the watermark of a full export, from its own UUIDs & update times."""
+    uuids = UUIDIndex(UUID(u.decode() if isinstance(u, bytes) else u).bytes for u in hf["uuids"][()])
+    update_times = hf["update_times"][()]
+    watermark = Watermark(
+        last_update_time_ms=int(update_times.max()) if len(update_times) else 0,
+        uuid_set_hash=uuids.digest(),
+    )
+    write_watermark(hf, watermark, uuids.to_array())
+
+
+def export_to_hdf5(
+    model_suffix: str,
+    export_size_max: int,
+    format_version: int = COLUMNAR_FORMAT_VERSION,
+    compression: Optional[str] = None,  # e.g. "gzip" or "lzf"; columnar format only
+    vector_encoding: str = "float32",  # "float32", "float16" or "int8"; columnar format only
+):
     with connect_to_weaviate() as client:  # Uses `weaviate.connect_to_local` under the hood
         chats = client.collections.get(CollectionName.SUPPORTCHAT)
 
-        class DateTimeEncoder(json.JSONEncoder):
-            def default(self, obj):
-                if isinstance(obj, datetime):
-                    return obj.isoformat()
-                return super().default(obj)
-
         # Save data to HDF5 file
         counter = 0
         actual_size = min(export_size_max, len(chats))
         print(f"Exporting {actual_size} objects to HDF5 file")
 
-        output_filename = f"export/twitter_customer_support_weaviate_export_{actual_size}_{model_suffix}.h5"
+        output_filename = f"export/twitter_customer_support_weaviate_export_{actual_size}_{model_suffix}{_encoding_suffix(vector_encoding)}.h5"
         if os.path.exists(output_filename):
             raise FileExistsError(
                 f"File {output_filename} already exists. Please remove it first."
             )
-        else:
+        elif format_version == COLUMNAR_FORMAT_VERSION:
+            with h5py.File(output_filename, "w") as hf, ColumnarWriter(
+                hf, compression=compression, vector_encoding=vector_encoding
+            ) as writer:
+                for wv_obj in tqdm(
+                    chats.iterator(
+                        include_vector=True,
+                        return_metadata=MetadataQuery(last_update_time=True),
+                    ),
+                    total=actual_size,
+                ):
+                    writer.add_object(
+                        uuid=str(wv_obj.uuid),
+                        properties=wv_obj.properties,
+                        vectors=wv_obj.vector,
+                        update_time_ms=_update_time_ms(wv_obj),
+                    )
+
+                    # Check if we should break
+                    counter += 1
+                    if counter >= actual_size:
+                        break
+                writer.close()
+                write_snapshot_watermark(hf)
+            _print_encoding_report(writer)
+        elif format_version == LEGACY_FORMAT_VERSION:
             with h5py.File(
                 output_filename,
                 "w",
@@ -52,11 +122,239 @@ def export_to_hdf5(model_suffix: str, export_size_max: int):
                     counter += 1
                     if counter >= actual_size:
                         break
+        else:
+            raise ValueError(f"Unknown export format version: {format_version}")
+
+
+def uuid_partitions(n: int) -> List[Tuple[Optional[UUID], Optional[UUID]]]:
+    """Split the UUID space into `n` equal ranges `[lo, hi)`; None means unbounded."""
+    bounds = [k * 2**128 // n for k in range(n + 1)]
+    return [
+        (UUID(int=bounds[k]) if k > 0 else None, UUID(int=bounds[k + 1]) if k < n - 1 else None)
+        for k in range(n)
+    ]
+
+
+def _export_partition(
+    lo: Optional[UUID],
+    hi: Optional[UUID],
+    path: str,
+    limit: int,
+    stop_event: threading.Event,
+    progress_bar: tqdm,
+    page_size: int = 500,
+    compression: Optional[str] = None,
+) -> int:
+    # Reads the range with its own cursor (& client); the cursor walks objects in UUID order
+    with connect_to_weaviate() as client, h5py.File(path, "w") as hf, ColumnarWriter(
+        hf, compression=compression
+    ) as writer:
+        chats = client.collections.get(CollectionName.SUPPORTCHAT)
+        # `after` is exclusive, so start just below `lo`
+        cursor = UUID(int=lo.int - 1) if lo is not None else None
+        n_read = 0
+        while n_read < limit and not stop_event.is_set():
+            response = chats.query.fetch_objects(
+                after=cursor,
+                limit=page_size,
+                include_vector=True,
+                return_metadata=MetadataQuery(last_update_time=True),
+            )
+            in_range = [
+                o for o in response.objects[: limit - n_read] if hi is None or o.uuid < hi
+            ]
+            for wv_obj in in_range:
+                writer.add_object(
+                    uuid=str(wv_obj.uuid),
+                    properties=wv_obj.properties,
+                    vectors=wv_obj.vector,
+                    update_time_ms=_update_time_ms(wv_obj),
+                )
+            n_read += len(in_range)
+            progress_bar.update(len(in_range))
+            if len(in_range) < len(response.objects) or len(response.objects) < page_size:
+                break  # Reached the end of the range, or of the collection
+            cursor = response.objects[-1].uuid
+    return writer.count
+
+
+def export_tiers(
+    model_suffix: str,
+    sizes: List[int],
+    n_partitions: int = 4,
+    compression: Optional[str] = None,
+    vector_encoding: str = "float32",
+):
+    """
+    Export the first N objects (in UUID order) for each N in `sizes`, in one collection scan.
+
+    The UUID space is split into `n_partitions` ranges, each read by its own cursor
+    in parallel into a partial file. Each tier is then assembled from the partial
+    files locally, so the collection is read once whatever the number of tiers.
+    Partial files keep float32 vectors; tiers are encoded with `vector_encoding`.
+    """
+    with connect_to_weaviate() as client:
+        n_total = len(client.collections.get(CollectionName.SUPPORTCHAT))
+
+    actual_sizes = sorted({min(size, n_total) for size in sizes})
+    output_filenames = {
+        size: f"export/twitter_customer_support_weaviate_export_{size}_{model_suffix}{_encoding_suffix(vector_encoding)}.h5"
+        for size in actual_sizes
+    }
+    for output_filename in output_filenames.values():
+        if os.path.exists(output_filename):
+            raise FileExistsError(
+                f"File {output_filename} already exists. Please remove it first."
+            )
+
+    max_size = actual_sizes[-1]
+    print(f"Exporting {max_size} objects with {n_partitions} cursors, for tiers {actual_sizes}")
+    with tempfile.TemporaryDirectory(dir="export") as tmp_dir:
+        part_paths = [os.path.join(tmp_dir, f"part_{k}.h5") for k in range(n_partitions)]
+        stop_event = threading.Event()
+        with tqdm(total=max_size) as progress_bar, ThreadPoolExecutor(
+            max_workers=n_partitions
+        ) as executor:
+            futures = [
+                # Any single range may hold all `max_size` objects that are needed
+                executor.submit(
+                    _export_partition, lo, hi, path, max_size, stop_event, progress_bar,
+                    compression=compression,
+                )
+                for (lo, hi), path in zip(uuid_partitions(n_partitions), part_paths)
+            ]
+            exported = 0
+            try:
+                for k, future in enumerate(futures):
+                    exported += future.result()
+                    if exported >= max_size:
+                        part_paths = part_paths[: k + 1]
+                        break
+            finally:
+                # Ranges after the last one needed (or after a failure) can stop early
+                stop_event.set()
+
+        for size in actual_sizes:
+            remaining = size
+            with h5py.File(output_filenames[size], "w") as hf, ColumnarWriter(
+                hf, compression=compression, vector_encoding=vector_encoding
+            ) as writer:
+                for path in part_paths:
+                    with h5py.File(path, "r") as part:
+                        n = min(remaining, len(ExportReader(part)))
+                        writer.append_rows(part, 0, n)
+                    remaining -= n
+                    if remaining == 0:
+                        break
+                writer.close()
+                write_snapshot_watermark(hf)
+            print(f"Wrote {writer.count} objects to {output_filenames[size]}")
+            _print_encoding_report(writer)
+
+
+def export_delta(
+    previous_path: str,
+    model_suffix: str,
+    compression: Optional[str] = None,
+    fetch_size: int = 100,
+    vector_encoding: str = "float32",
+) -> str:
+    """
+    Export the objects created or updated since the watermark of `previous_path`
+    (a full or delta export), and the UUIDs deleted since.
+
+    Changes are found from one scan of UUIDs & update times only; vectors are
+    fetched for the changed objects alone. Returns the new file's path.
+    """
+    with h5py.File(previous_path, "r") as hf:
+        previous = read_watermark(hf)
+        if previous is None:
+            raise ValueError(f"{previous_path} has no watermark; export a full snapshot first")
+        previous_uuids = UUIDIndex.from_array(read_uuid_set(hf))
+
+    with connect_to_weaviate() as client:
+        chats = client.collections.get(CollectionName.SUPPORTCHAT)
+
+        current = UUIDIndex()
+        changed: List[UUID] = []
+        last_update_time_ms = previous.last_update_time_ms
+        for uuid, update_time_ms in tqdm(iter_update_times(chats), desc="Scanning for changes"):
+            current.add(uuid)
+            # `>=`: objects updated within the watermark's millisecond may have been missed.
+            # Objects missing from the previous file (e.g. a partial export) count as changed too.
+            if update_time_ms >= previous.last_update_time_ms or uuid not in previous_uuids:
+                changed.append(uuid)
+            last_update_time_ms = max(last_update_time_ms, update_time_ms)
+
+        output_filename = (
+            f"export/twitter_customer_support_weaviate_delta_{last_update_time_ms}_{model_suffix}{_encoding_suffix(vector_encoding)}.h5"
+        )
+        if os.path.exists(output_filename):
+            raise FileExistsError(
+                f"File {output_filename} already exists. Please remove it first."
+            )
+
+        fetched = set()
+        with h5py.File(output_filename, "w") as hf:
+            with ColumnarWriter(
+                hf, compression=compression, vector_encoding=vector_encoding
+            ) as writer:
+                for i in tqdm(range(0, len(changed), fetch_size), desc="Exporting changes"):
+                    ids = changed[i : i + fetch_size]
+                    response = chats.query.fetch_objects(
+                        filters=Filter.by_id().contains_any(ids),
+                        limit=len(ids),
+                        include_vector=True,
+                        return_metadata=MetadataQuery(last_update_time=True),
+                    )
+                    for wv_obj in response.objects:
+                        writer.add_object(
+                            uuid=str(wv_obj.uuid),
+                            properties=wv_obj.properties,
+                            vectors=wv_obj.vector,
+                            update_time_ms=_update_time_ms(wv_obj),
+                        )
+                        fetched.add(wv_obj.uuid)
+
+            # Objects deleted between the scan and the fetch are deletions too
+            for uuid in changed:
+                if uuid not in fetched:
+                    current.discard(uuid)
+            deleted = [str(UUID(bytes=key)) for key in previous_uuids.keys - current.keys]
+
+            watermark = Watermark(
+                last_update_time_ms=last_update_time_ms,
+                uuid_set_hash=current.digest(),
+                base_uuid_set_hash=previous.uuid_set_hash,
+            )
+            write_watermark(hf, watermark, current.to_array(), deleted)
+
+    print(f"Exported {writer.count} changed and {len(deleted)} deleted objects to {output_filename}")
+    return output_filename
+
+
+main = export_tiers
 
 
-main = export_to_hdf5
+@click.command()
+@click.option("--model-suffix", default="cohere-embed-multilingual-light-v3.0")
+@click.option("--since", default=None, help="Previous export file; export only the changes since its watermark.")
+@click.option(
+    "--vector-encoding",
+    type=click.Choice(VECTOR_ENCODINGS),
+    default="float32",
+    help="Store vectors as float32, float16 or per-dimension scaled int8.",
+)
+def cli(model_suffix, since, vector_encoding):
+    if since:
+        export_delta(since, model_suffix=model_suffix, vector_encoding=vector_encoding)
+    else:
+        main(
+            model_suffix=model_suffix,
+            sizes=[10000, 50000, 100000, 200000],
+            vector_encoding=vector_encoding,
+        )
 
 
 if __name__ == "__main__":
-    for size in [10000, 50000, 100000, 200000]:
-        main(model_suffix="cohere-embed-multilingual-light-v3.0", export_size_max=size)
+    cli()
@@ -0,0 +1,74 @@
+# File: ./5_benchmark_queries.py
+from helpers import connect_to_weaviate
+from benchmarking import (
+    load_workload,
+    run_load,
+    summarize,
+    save_recording,
+    WeaviateQueryBackend,
+    ReplayQueryBackend,
+    StandInServer,
+)
+import click
+import json
+import time
+
+
+@click.command()
+@click.option("--workload", default="prep/dev/workloads/support_queries.jsonl", help="Workload file (JSON Lines).")
+@click.option("--n-requests", default=1000, help="Number of requests to send (cycling through the workload).")
+@click.option("--concurrency", default=8, help="Max. concurrent requests.")
+@click.option("--qps", default=None, type=float, help="Target request rate (open loop). Default: as fast as `--concurrency` allows.")
+@click.option("--output", default="query_benchmark.json", help="Where to write the JSON report.")
+@click.option("--record", default=None, help="Also save responses here, to replay offline with `--replay`.")
+@click.option("--replay", default=None, help="Run against a local stand-in server replaying this recording, instead of Weaviate.")
+@click.option("--speedup", default=1.0, help="With `--replay`: divide the recorded service times by this.")
+def benchmark(workload, n_requests, concurrency, qps, output, record, replay, speedup):
+    """Replay a query workload at a target QPS or concurrency, and report latency per search type."""
+    queries = load_workload(workload)
+
+    start = time.perf_counter()
+    if replay:
+        with StandInServer(replay, speedup=speedup) as server:
+            results = run_load(
+                ReplayQueryBackend(server.url), queries, n_requests, concurrency, qps
+            )
+    else:
+        with connect_to_weaviate() as client:  # Uses `weaviate.connect_to_local` under the hood
+            results = run_load(
+                WeaviateQueryBackend(client), queries, n_requests, concurrency, qps
+            )
+    wall_time_s = time.perf_counter() - start
+
+    report = {
+        "config": {
+            "workload": workload,
+            "n_requests": n_requests,
+            "concurrency": concurrency,
+            "qps": qps,
+            "target": f"replay:{replay}" if replay else "weaviate",
+            "wall_time_s": wall_time_s,
+        },
+        "results": summarize(results, wall_time_s),
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for label, stats in report["results"].items():
+        latency = stats["latency"]
+        print(
+            f"{label:>12}: {stats['requests']} requests, {stats['throughput_qps']:.1f} qps, "
+            f"errors {stats['error_rate']:.1%}, "
+            f"p50 {latency.get('p50_ms', float('nan')):.1f} ms, "
+            f"p95 {latency.get('p95_ms', float('nan')):.1f} ms, "
+            f"p99 {latency.get('p99_ms', float('nan')):.1f} ms"
+        )
+    print(f"Report written to {output}")
+
+    if record:
+        save_recording(results, record)
+        print(f"Responses recorded to {record}")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,75 @@
+# File: ./6_benchmark_ingest.py
+from helpers import CollectionName, connect_to_weaviate
+from importer import BatchStrategy, import_range, count_objects
+from benchmarking import ResourceMonitor, format_table
+from dataclasses import replace
+import itertools
+import click
+import json
+
+
+def recreate_collection(source_name: str, bench_name: str) -> None:
+    # A fresh, empty copy of the source collection's configuration, so every run inserts
+    with connect_to_weaviate() as client:  # Uses `weaviate.connect_to_local` under the hood
+        config = client.collections.get(source_name).config.get()
+        client.collections.delete(bench_name)
+        client.collections.create_from_config(replace(config, name=bench_name))
+
+
+def strategy_grid(batch_sizes, concurrent_requests, requests_per_minute):
+    for batch_size, concurrency in itertools.product(batch_sizes, concurrent_requests):
+        yield BatchStrategy("fixed_size", batch_size=batch_size, concurrent_requests=concurrency)
+    yield BatchStrategy("dynamic")
+    for rpm in requests_per_minute:
+        yield BatchStrategy("rate_limit", requests_per_minute=rpm)
+
+
+def _ints(value: str):
+    return [int(v) for v in value.split(",") if v]
+
+
+@click.command()
+@click.option("--file", "file_path", default="data/twitter_customer_support_cohere.h5", help="HDF5 export file to import.")
+@click.option("--n-objects", default=10000, help="Size of the slice to import in each run.")
+@click.option("--batch-sizes", default="100,200,500,1000", help="Comma-separated fixed-size batch sizes.")
+@click.option("--concurrent-requests", default="1,2,4", help="Comma-separated concurrent request counts (fixed-size only).")
+@click.option("--requests-per-minute", default="2400,4800,9600", help="Comma-separated rate limits.")
+@click.option("--bench-collection", default=f"{CollectionName.SUPPORTCHAT.value}Bench", help="Scratch collection, recreated for each run.")
+@click.option("--output", default="ingest_benchmark.json", help="Where to write the JSON results.")
+def benchmark(file_path, n_objects, batch_sizes, concurrent_requests, requests_per_minute, bench_collection, output):
+    """Import the same HDF5 slice with each batching strategy & setting, and compare them."""
+    n_objects = min(n_objects, count_objects(file_path))
+    rows = []
+    for strategy in strategy_grid(
+        _ints(batch_sizes), _ints(concurrent_requests), _ints(requests_per_minute)
+    ):
+        recreate_collection(CollectionName.SUPPORTCHAT, bench_collection)
+        print(f"Running {strategy.label}...")
+        with ResourceMonitor() as monitor:
+            report = import_range(
+                file_path, 0, n_objects, strategy=strategy, collection_name=bench_collection
+            )
+        rows.append(
+            {
+                "strategy": strategy.label,
+                "objects_per_s": report.total / monitor.wall_s if monitor.wall_s else 0.0,
+                "wall_s": monitor.wall_s,
+                "client_cpu_s": monitor.cpu_s,
+                "client_cpu_pct": 100 * monitor.cpu_s / monitor.wall_s if monitor.wall_s else 0.0,
+                "peak_rss_mb": monitor.peak_rss_bytes / 2**20,
+                "failed": len(report.failed_objects),
+            }
+        )
+
+    with connect_to_weaviate() as client:
+        client.collections.delete(bench_collection)
+
+    rows.sort(key=lambda r: r["objects_per_s"], reverse=True)
+    print(format_table(rows, list(rows[0].keys())))
+    with open(output, "w") as f:
+        json.dump({"file": file_path, "n_objects": n_objects, "runs": rows}, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    benchmark()
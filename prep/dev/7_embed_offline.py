@@ -0,0 +1,104 @@
+# File: ./7_embed_offline.py
+from helpers import get_data_objects
+from hdf5_io import ColumnarWriter
+from embeddings import CohereEmbedder, OpenAIEmbedder, OllamaEmbedder, embed_batches
+from importer import import_from_hdf5, print_import_report
+from weaviate.util import generate_uuid5
+from collections import deque
+from tqdm import tqdm
+import itertools
+import click
+import h5py
+
+
+# Source properties of each named vector, as in `1_create_collection.py`
+VECTOR_SOURCES = {
+    "text": ["text"],
+    "text_with_metadata": ["text", "company_author"],
+}
+
+EMBEDDERS = {
+    "cohere": lambda model: CohereEmbedder(
+        model=model or "embed-multilingual-light-v3.0", input_type="search_document"
+    ),
+    "openai": lambda model: OpenAIEmbedder(model=model or "text-embedding-3-small"),
+    "ollama": lambda model: OllamaEmbedder(model=model or "nomic-embed-text"),
+}
+
+
+def _source_text(obj, properties) -> str:
+    return " ".join(str(obj[p]) for p in properties)
+
+
+def _skip_done(objects, writer: ColumnarWriter, hf: h5py.File):
+    # Objects are written in source order, so resuming means skipping the first `count`
+    done = writer.count
+    if done == 0:
+        return objects
+    skipped = list(itertools.islice(objects, done))
+    last = hf["uuids"][done - 1]
+    last = last.decode() if isinstance(last, bytes) else last
+    if len(skipped) < done or str(generate_uuid5(skipped[-1])) != last:
+        raise ValueError("The output file does not match the source data; remove it to start over")
+    return objects
+
+
+@click.command()
+@click.option("--provider", type=click.Choice(sorted(EMBEDDERS)), default="cohere")
+@click.option("--model", default=None, help="Embedding model; the provider default of the workshop if unset.")
+@click.option("--output", default=None, help="HDF5 file to write (or resume); derived from the provider if unset.")
+@click.option("--max-objects", default=200000)
+@click.option("--batch-size", default=96, help="Texts per provider call (Cohere accepts up to 96).")
+@click.option("--concurrency", default=4, help="Provider calls in flight.")
+@click.option("--max-retries", default=5)
+@click.option("--import", "run_import", is_flag=True, help="Import the file into Weaviate once done.")
+@click.option("--import-workers", default=1)
+def embed_offline(provider, model, output, max_objects, batch_size, concurrency, max_retries, run_import, import_workers):
+    """
+    Embed the dataset client-side, writing objects & both named vectors to an export file.
+
+    Re-running with the same output file resumes after the last object written.
+    Importing the file is then a bring-your-own-vectors bulk load, with no
+    vectorizer calls inside Weaviate.
+    """
+    embedder = EMBEDDERS[provider](model)
+    output = output or f"data/twitter_customer_support_{provider}_offline.h5"
+
+    with h5py.File(output, "a") as hf, ColumnarWriter(hf) as writer:
+        if hf.attrs.get("embedding_model", embedder.name) != embedder.name:
+            raise ValueError(f"{output} holds vectors from {hf.attrs['embedding_model']}, not {embedder.name}")
+        hf.attrs["embedding_model"] = embedder.name
+
+        objects = itertools.islice(get_data_objects(max_text_length=8000), max_objects)
+        objects = _skip_done(objects, writer, hf)
+        chunks: deque = deque()
+
+        def _text_batches():
+            # One batch per named vector per chunk; the chunk waits in `chunks` for its vectors
+            while True:
+                chunk = list(itertools.islice(objects, batch_size))
+                if not chunk:
+                    return
+                chunks.append(chunk)
+                for properties in VECTOR_SOURCES.values():
+                    yield [_source_text(obj, properties) for obj in chunk]
+
+        results = embed_batches(embedder, _text_batches(), concurrency=concurrency, max_retries=max_retries)
+        with tqdm(total=max_objects, initial=writer.count, desc=f"Embedding with {embedder.name}") as progress_bar:
+            for vectors in zip(*[results] * len(VECTOR_SOURCES)):
+                chunk = chunks.popleft()
+                for i, obj in enumerate(chunk):
+                    writer.add_object(
+                        uuid=str(generate_uuid5(obj)),
+                        properties=obj,
+                        vectors={name: v[i] for name, v in zip(VECTOR_SOURCES, vectors)},
+                    )
+                progress_bar.update(len(chunk))
+
+    print(f"Wrote {writer.count} objects to {output}")
+    if run_import:
+        print_import_report(import_from_hdf5(output, n_workers=import_workers))
+
+
+if __name__ == "__main__":
+    embed_offline()
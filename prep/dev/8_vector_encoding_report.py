@@ -0,0 +1,53 @@
+# File: ./8_vector_encoding_report.py
+from hdf5_io import ExportReader, VECTOR_ENCODINGS, encoding_error
+from benchmarking import format_table
+import numpy as np
+import click
+import h5py
+import json
+
+
+@click.command()
+@click.argument("files", nargs=-1, required=True)
+@click.option("--sample", default=20000, help="Vectors per file & vector name to evaluate.")
+@click.option("--output", default=None, help="Also write the results as JSON.")
+def report(files, sample, output):
+    """
+    Cosine error of storing each file's vectors as float16 or int8, instead of float32.
+
+    Pass one float32 export per embedding model, to decide on an encoding per model.
+    """
+    rows = []
+    for file_path in files:
+        with h5py.File(file_path, "r") as hf:
+            reader = ExportReader(hf)
+            stop = min(sample, len(reader))
+            vectors = {}
+            for block in reader.iter_blocks(0, stop):
+                for name, v in block.vectors.items():
+                    vectors.setdefault(name, []).append(v)
+
+        for name, blocks in vectors.items():
+            v = np.concatenate(blocks)
+            for encoding in VECTOR_ENCODINGS[1:]:
+                rows.append(
+                    {
+                        "file": file_path,
+                        "vector": name,
+                        "dim": v.shape[1],
+                        "encoding": encoding,
+                        "size_vs_float32": f"{np.dtype(encoding).itemsize / 4:.0%}",
+                        **encoding_error(v, encoding),
+                    }
+                )
+
+    columns = ["file", "vector", "dim", "encoding", "size_vs_float32", "mean_cosine_error", "p99_cosine_error", "max_cosine_error"]
+    print(format_table([{**r, **{k: f"{r[k]:.2e}" for k in columns if k.endswith("_error")}} for r in rows], columns))
+    if output:
+        with open(output, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    report()
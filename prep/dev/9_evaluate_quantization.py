@@ -0,0 +1,209 @@
+# File: ./9_evaluate_quantization.py
+from helpers import connect_to_weaviate
+from hdf5_io import ExportReader
+from metrics_collector import summarize_nodes
+from pprof_profile import fetch_profile, DEFAULT_HEAP_URL
+from benchmarking import latency_summary, format_table
+from weaviate.classes.config import Configure
+from typing import Dict, List, Tuple
+import numpy as np
+import click
+import h5py
+import json
+import time
+
+
+# As in the commented-out options of `1_create_collection.py`
+QUANTIZERS = {
+    "none": lambda training_limit: None,
+    "bq": lambda training_limit: Configure.VectorIndex.Quantizer.bq(),
+    "sq": lambda training_limit: Configure.VectorIndex.Quantizer.sq(training_limit=training_limit),
+    "pq": lambda training_limit: Configure.VectorIndex.Quantizer.pq(training_limit=training_limit),
+}
+
+
+def load_vectors(
+    file_path: str, n_objects: int, n_queries: int
+) -> Tuple[List[str], Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """
+    UUIDs & vectors of the first `n_objects` objects of an export file, to index, and the
+    vectors of the next `n_queries` objects, to query with (so queries are not in the index).
+    """
+    with h5py.File(file_path, "r") as hf:
+        reader = ExportReader(hf)
+        if len(reader) < n_objects + n_queries:
+            raise click.BadParameter(
+                f"{file_path} holds {len(reader)} objects; need {n_objects} + {n_queries} queries"
+            )
+        uuids: List[str] = []
+        vectors: Dict[str, List[np.ndarray]] = {}
+        for block in reader.iter_blocks(0, n_objects + n_queries):
+            uuids.extend(block.uuids)
+            for name, v in block.vectors.items():
+                vectors.setdefault(name, []).append(v)
+    stacked = {name: np.concatenate(blocks) for name, blocks in vectors.items()}
+    return (
+        uuids[:n_objects],
+        {name: v[:n_objects] for name, v in stacked.items()},
+        {name: v[n_objects:] for name, v in stacked.items()},
+    )
+
+
+def _normalize(v: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(v, axis=1, keepdims=True)
+    return v / np.where(norms == 0, 1, norms)
+
+
+def exact_top_k(data: np.ndarray, queries: np.ndarray, k: int, batch_size: int = 256) -> np.ndarray:
+    """Row indices of the `k` nearest `data` rows to each query by cosine distance, nearest first."""
+    data = _normalize(data)
+    queries = _normalize(queries)
+    top_k = np.empty((len(queries), k), dtype=np.int64)
+    for start in range(0, len(queries), batch_size):
+        scores = queries[start : start + batch_size] @ data.T
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1)
+        top_k[start : start + batch_size] = np.take_along_axis(candidates, order, axis=1)
+    return top_k
+
+
+def heap_mb(heap_url: str) -> float:
+    # `gc=1` runs a garbage collection first, so the in-use size is comparable between runs
+    return fetch_profile(f"{heap_url}?gc=1").totals()["inuse_space"] / 2**20
+
+
+def build_collection(client, name, quantizer, uuids, vectors, batch_size: int = 500):
+    """A collection with one bring-your-own-vectors HNSW index per named vector, filled with `vectors`."""
+    client.collections.delete(name)
+    collection = client.collections.create(
+        name=name,
+        vectorizer_config=[
+            Configure.NamedVectors.none(
+                name=vector_name,
+                vector_index_config=Configure.VectorIndex.hnsw(quantizer=quantizer),
+            )
+            for vector_name in vectors
+        ],
+    )
+    with collection.batch.fixed_size(batch_size=batch_size) as batch:
+        for i, uuid in enumerate(uuids):
+            batch.add_object(
+                uuid=uuid, properties={}, vector={k: v[i] for k, v in vectors.items()}
+            )
+    if collection.batch.failed_objects:
+        raise RuntimeError(
+            f"Failed to import {len(collection.batch.failed_objects)} objects: "
+            f"{collection.batch.failed_objects[0].message}"
+        )
+    return collection
+
+
+def wait_for_indexing(client, name: str, timeout: float = 600) -> None:
+    # Quantizers with a training limit compress the index once enough objects are in
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        snapshot = summarize_nodes(client.cluster.nodes(collection=name, output="verbose"))
+        if all(s.indexing_status == "READY" and s.vector_queue_length == 0 for s in snapshot.shards):
+            return
+        time.sleep(1)
+    raise TimeoutError(f"{name} was still indexing after {timeout}s")
+
+
+def run_queries(collection, target_vector: str, queries: np.ndarray, k: int, warmup: int = 20):
+    """UUIDs returned for each query, and each query's latency in seconds."""
+    for q in queries[:warmup]:
+        collection.query.near_vector(near_vector=q.tolist(), target_vector=target_vector, limit=k)
+    results, latencies = [], []
+    for q in queries:
+        start = time.perf_counter()
+        response = collection.query.near_vector(
+            near_vector=q.tolist(), target_vector=target_vector, limit=k
+        )
+        latencies.append(time.perf_counter() - start)
+        results.append([str(o.uuid) for o in response.objects])
+    return results, latencies
+
+
+def recall_at_k(results: List[List[str]], truth: List[List[str]], k: int) -> float:
+    return float(np.mean([len(set(r[:k]) & set(t[:k])) / k for r, t in zip(results, truth)]))
+
+
+@click.command()
+@click.option("--file", "file_path", default="data/twitter_customer_support_cohere.h5", help="HDF5 export file with the vectors.")
+@click.option("--n-objects", default=50000, help="Objects to index in each collection.")
+@click.option("--n-queries", default=200, help="Held-out vectors to query with.")
+@click.option("--k", default=10, help="Evaluate recall@k.")
+@click.option("--target-vector", default="text_with_metadata")
+@click.option("--quantizers", default="none,bq,sq,pq", help="Comma-separated, from: " + ", ".join(QUANTIZERS))
+@click.option("--training-limit", default=25000, help="sq & pq training limit (capped at --n-objects).")
+@click.option("--heap-url", default=DEFAULT_HEAP_URL, help="Weaviate's pprof heap endpoint.")
+@click.option("--collection", "collection_name", default="SupportChatQuantEval", help="Scratch collection, recreated for each quantizer.")
+@click.option("--output", default="quantization_eval.json", help="Where to write the JSON results.")
+def evaluate(file_path, n_objects, n_queries, k, target_vector, quantizers, training_limit, heap_url, collection_name, output):
+    """
+    Compare recall@k, query latency & Weaviate heap use of each vector index quantizer.
+
+    Ground truth is exact (brute-force) cosine top-k over the file's vectors. Each
+    quantizer gets a fresh collection with the same objects, built one at a time so
+    the heap of each can be measured against an empty baseline.
+    """
+    quantizers = [q.strip() for q in quantizers.split(",") if q.strip()]
+    unknown = set(quantizers) - set(QUANTIZERS)
+    if unknown:
+        raise click.BadParameter(f"Unknown quantizers: {sorted(unknown)}")
+
+    uuids, vectors, queries = load_vectors(file_path, n_objects, n_queries)
+    if target_vector not in vectors:
+        raise click.BadParameter(f"No vector {target_vector!r} in {file_path}; found {sorted(vectors)}")
+    print(f"Computing exact top-{k} for {n_queries} queries over {n_objects} vectors...")
+    truth_idx = exact_top_k(vectors[target_vector], queries[target_vector], k)
+    truth = [[uuids[i] for i in row] for row in truth_idx]
+
+    rows = []
+    with connect_to_weaviate() as client:  # Uses `weaviate.connect_to_local` under the hood
+        for name in quantizers:
+            client.collections.delete(collection_name)
+            baseline_mb = heap_mb(heap_url)
+
+            print(f"Building the collection with quantizer: {name}...")
+            start = time.perf_counter()
+            quantizer = QUANTIZERS[name](min(training_limit, n_objects))
+            collection = build_collection(client, collection_name, quantizer, uuids, vectors)
+            wait_for_indexing(client, collection_name)
+            build_s = time.perf_counter() - start
+            indexed_mb = heap_mb(heap_url)
+
+            results, latencies = run_queries(collection, target_vector, queries[target_vector], k)
+            latency = latency_summary(latencies)
+            rows.append(
+                {
+                    "quantizer": name,
+                    f"recall@{k}": recall_at_k(results, truth, k),
+                    "p50_ms": latency["p50_ms"],
+                    "p95_ms": latency["p95_ms"],
+                    "p99_ms": latency["p99_ms"],
+                    "heap_mb": indexed_mb,
+                    "heap_delta_mb": indexed_mb - baseline_mb,
+                    "build_s": build_s,
+                }
+            )
+        client.collections.delete(collection_name)
+
+    print(format_table([{**r, f"recall@{k}": f"{r[f'recall@{k}']:.3f}"} for r in rows], list(rows[0].keys())))
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "file": file_path,
+                "n_objects": n_objects,
+                "n_queries": n_queries,
+                "target_vector": target_vector,
+                "runs": rows,
+            },
+            f,
+            indent=2,
+        )
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    evaluate()
@@ -1,16 +1,28 @@
 import os
 import click
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Optional, Tuple
 from tqdm import tqdm
+import threading
+import hashlib
 import shutil
+import json
+import time
+import re
+
+
+# Size of each HTTP range request; also the unit of resumption
+PIECE_SIZE = 16 * 2**20
 
 
 @click.command()
 @click.option("--provider", default="ollama", help="Which model provider to use.")
 @click.option("--dataset-size", default="50000", help="Size of the dataset to use.")
 @click.option("--use-cache", is_flag=True, default=True, help="Use cached files if available.")
-def download(provider, dataset_size, use_cache):
+@click.option("--download-workers", default=8, help="Parallel connections per download.")
+def download(provider, dataset_size, use_cache, download_workers):
     """Download prerequisite files & confirm required aspects."""
     available_dataset_sizes = ["10000", "50000", "100000", "200000"]
     available_providers = ["ollama", "openai", "cohere"]
@@ -40,7 +52,7 @@ def download(provider, dataset_size, use_cache):
             if use_cache:
                 print(f"No cached file {dl_filename} found.")
             url = f"https://weaviate-workshops.s3.eu-west-2.amazonaws.com/odsc-europe-2024/twitter_customer_support_weaviate_export_{dataset_size}_nomic.h5"
-            download_file(url, data_dir / dl_filename)
+            download_file(url, data_dir / dl_filename, workers=download_workers)
 
         # Run Ollama commands
         print("Running 'ollama pull nomic-embed-text'...")
@@ -60,7 +72,7 @@ def download(provider, dataset_size, use_cache):
             if use_cache:
                 print(f"No cached file {dl_filename} found.")
             url = f"https://weaviate-workshops.s3.eu-west-2.amazonaws.com/odsc-europe-2024/twitter_customer_support_weaviate_export_{dataset_size}_openai-text-embedding-3-small.h5"
-            download_file(url, data_dir / dl_filename)
+            download_file(url, data_dir / dl_filename, workers=download_workers)
 
         # Check for OPENAI_API_KEY
         if not os.environ.get("OPENAI_API_KEY"):
@@ -79,7 +91,7 @@ def download(provider, dataset_size, use_cache):
             if use_cache:
                 print(f"No cached file {dl_filename} found.")
             url = f"https://weaviate-workshops.s3.eu-west-2.amazonaws.com/odsc-europe-2024/twitter_customer_support_weaviate_export_{dataset_size}_cohere-embed-multilingual-light-v3.0.h5"
-            download_file(url, data_dir / dl_filename)
+            download_file(url, data_dir / dl_filename, workers=download_workers)
 
         # Check for COHERE_API_KEY
         if not os.environ.get("COHERE_API_KEY"):
@@ -90,7 +102,7 @@ def download(provider, dataset_size, use_cache):
     else:
         print(f"Sorry, the provider value '{provider}' is not supported.")
 
-    shutil.copy(data_dir / dl_filename, data_dir / out_filename)
+    link_file(data_dir / dl_filename, data_dir / out_filename)
 
     # Copy appropriate configuration file
     for src_config, dest_config in [
@@ -101,24 +113,166 @@ def download(provider, dataset_size, use_cache):
         print(f"Copied {src_config} to {dest_config}")
 
 
-def download_file(url, filepath):
-    temp_filepath = filepath.with_suffix(".part")
+def link_file(src: Path, dst: Path) -> None:
+    """Make `dst` refer to `src` without copying it: a hard link, else a symlink, else a copy."""
+    if dst.exists() or dst.is_symlink():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        try:
+            dst.symlink_to(src.resolve())
+        except OSError:
+            shutil.copy(src, dst)
 
-    print(f"Downloading {url}...")
-    response = requests.get(url, stream=True)
+
+def _probe(url: str) -> Tuple[int, bool, Optional[str]]:
+    # Size, whether ranged requests are supported, and ETag
+    response = requests.head(url, allow_redirects=True, timeout=30)
     response.raise_for_status()
-    total_size = int(response.headers.get("content-length", 0))
+    size = int(response.headers.get("content-length", 0))
+    ranged = response.headers.get("accept-ranges", "").lower() == "bytes" and size > 0
+    return size, ranged, response.headers.get("etag")
+
+
+def _expected_checksum(url: str, etag: Optional[str], sha256: Optional[str]) -> Optional[Tuple[str, str]]:
+    """`(algorithm, hex digest)` to verify against: given, from a `.sha256` file next to the URL, or the ETag."""
+    if sha256:
+        return "sha256", sha256.lower()
+    try:
+        response = requests.get(f"{url}.sha256", timeout=10)
+        if response.ok and response.text.strip():
+            return "sha256", response.text.split()[0].lower()
+    except requests.RequestException:
+        pass
+    # S3 ETags of single-part uploads are the MD5 of the content (multipart ones end in "-<parts>")
+    etag = (etag or "").strip('"').lower()
+    if re.fullmatch(r"[0-9a-f]{32}", etag):
+        return "md5", etag
+    return None
+
+
+def _file_digest(path: Path, algorithm: str) -> str:
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as file:
+        while chunk := file.read(8 * 2**20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _download_piece(url: str, path: Path, start: int, end: int, progress_bar: tqdm, retries: int = 5) -> None:
+    # Each piece writes through its own file handle, at its own offset
+    for attempt in range(retries + 1):
+        written = 0
+        try:
+            with requests.get(
+                url, headers={"Range": f"bytes={start}-{end - 1}"}, stream=True, timeout=60
+            ) as response, open(path, "r+b") as file:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    # Not transient, so not retried
+                    raise RuntimeError("The server ignored the range request")
+                file.seek(start)
+                for data in response.iter_content(chunk_size=2**20):
+                    written += file.write(data)
+                    progress_bar.update(len(data))
+            if written != end - start:
+                raise IOError(f"Got {written} of {end - start} bytes")
+            return
+        except (requests.RequestException, IOError) as e:
+            progress_bar.update(-written)
+            if attempt == retries:
+                raise
+            print(f"Range {start}-{end - 1} failed ({e}); retrying")
+            time.sleep(min(30, 2**attempt))
+
+
+def _download_ranged(url: str, temp_filepath: Path, size: int, etag: Optional[str], workers: int) -> None:
+    state_filepath = temp_filepath.with_suffix(".part.json")
+    pieces = [(start, min(start + PIECE_SIZE, size)) for start in range(0, size, PIECE_SIZE)]
 
-    with open(temp_filepath, "wb") as file, tqdm(
-        desc=filepath.name,
-        total=total_size,
+    # Resume from a previous attempt at the same file, if any
+    done = set()
+    state = {"url": url, "size": size, "etag": etag}
+    if temp_filepath.exists() and state_filepath.exists():
+        previous = json.loads(state_filepath.read_text())
+        if all(previous.get(k) == v for k, v in state.items()) and temp_filepath.stat().st_size == size:
+            done = set(previous["done"])
+            print(f"Resuming: {len(done)} of {len(pieces)} pieces already downloaded")
+    if not done:
+        with open(temp_filepath, "wb") as file:
+            file.truncate(size)
+
+    lock = threading.Lock()
+    with tqdm(
+        desc=temp_filepath.with_suffix("").name,
+        total=size,
+        initial=sum(pieces[i][1] - pieces[i][0] for i in done),
         unit="iB",
         unit_scale=True,
         unit_divisor=1024,
-    ) as progress_bar:
-        for data in response.iter_content(chunk_size=1024):
-            size = file.write(data)
-            progress_bar.update(size)
+    ) as progress_bar, ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_download_piece, url, temp_filepath, start, end, progress_bar): i
+            for i, (start, end) in enumerate(pieces)
+            if i not in done
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except BaseException:
+                # Don't start the remaining pieces; the ones in progress finish on exit
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+            with lock:
+                done.add(futures[future])
+                state_filepath.write_text(json.dumps({**state, "done": sorted(done)}))
+    state_filepath.unlink()
+
+
+def _download_stream(url: str, temp_filepath: Path, size: int) -> None:
+    # Fallback for servers without range support: one connection, from the start
+    with requests.get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        with open(temp_filepath, "wb") as file, tqdm(
+            desc=temp_filepath.with_suffix("").name,
+            total=size,
+            unit="iB",
+            unit_scale=True,
+            unit_divisor=1024,
+        ) as progress_bar:
+            for data in response.iter_content(chunk_size=2**20):
+                progress_bar.update(file.write(data))
+
+
+def download_file(url, filepath, workers: int = 8, sha256: Optional[str] = None):
+    """
+    Download `url` to `filepath` with parallel range requests, and verify its checksum.
+
+    Completed pieces are recorded next to the `.part` file, so an interrupted
+    download resumes where it stopped.
+    """
+    temp_filepath = filepath.with_suffix(".part")
+
+    print(f"Downloading {url}...")
+    size, ranged, etag = _probe(url)
+    if ranged:
+        _download_ranged(url, temp_filepath, size, etag, workers)
+    else:
+        _download_stream(url, temp_filepath, size)
+
+    expected = _expected_checksum(url, etag, sha256)
+    if expected is None:
+        print("Warning: no checksum available; skipping verification.")
+    else:
+        algorithm, expected_digest = expected
+        actual_digest = _file_digest(temp_filepath, algorithm)
+        if actual_digest != expected_digest:
+            temp_filepath.unlink()
+            raise IOError(
+                f"{algorithm} mismatch for {url}: expected {expected_digest}, got {actual_digest}"
+            )
+        print(f"Verified {algorithm} checksum.")
 
     temp_filepath.rename(filepath)
     print(f"File downloaded to {filepath}")